@@ -1,5 +1,29 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
 from PIL import Image,ImageDraw,ImageFont
 
+
+def downsample_minmax(x, y):
+    """
+    x座標のピクセル列ごとに最小値と最大値の点だけを残す（M4方式の間引き）
+    スパイクを残したまま、頂点数を最大で「列数 x 2」に抑える
+    :param x: x座標の配列（昇順）
+    :param y: y座標の配列
+    :return: 間引き後の (x, y)
+    """
+    cols = np.floor(x).astype(np.int64)
+    # 列ごとに y の昇順で並べ、各列の先頭（最小）と末尾（最大）を取り出す
+    order = np.lexsort((y, cols))
+    starts = np.flatnonzero(np.r_[True, cols[order][1:] != cols[order][:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+    # 各列の2点を時間順に並べ、最小と最大が同じ点なら1点にする
+    idx = np.sort(np.column_stack((order[starts], order[ends])), axis=1).ravel()
+    idx = idx[np.r_[True, idx[1:] != idx[:-1]]]
+    return x[idx], y[idx]
+
+
 class DrawGraph:
     def __init__(self, width, height, bg_color):
         self.image = Image.new('RGB', (width, height), bg_color)
@@ -8,6 +32,43 @@ class DrawGraph:
         self.draw = ImageDraw.Draw(self.image)
         self.bg_color = bg_color
         self.box_color = (255,255,255)
+        self.layers = OrderedDict()  # 縦軸の範囲ごとの背景（補助線）画像
+        self.max_layers = 8
+        self.drawn_data = None  # 前回描画したデータ（同じなら描き直さない）
+        self.forecast_color = (0, 160, 0)
+        self.forecast_dot_gap = 8  # 予測線の点の間隔（ピクセル）
+
+    def background(self, min_value, max_value, value_range):
+        """
+        背景と補助線を描いた画像を返す（縦軸の範囲ごとにキャッシュする）
+        :param min_value: 縦軸の最小値
+        :param max_value: 縦軸の最大値
+        :param value_range: 縦軸の範囲
+        :return: PIL Image オブジェクト
+        """
+        key = (min_value, max_value, value_range)
+        layer = self.layers.get(key)
+        if layer is not None:
+            self.layers.move_to_end(key)
+            return layer
+
+        layer = Image.new('RGB', (self.width, self.height), self.bg_color)
+        draw = ImageDraw.Draw(layer)
+
+        # 外側の枠線を描画
+        #draw.rectangle([0, 0, self.width-1, self.height-1], outline=self.box_color)
+
+        # 100と200の補助線を引く
+        line_dash = [2, 5, 2]
+        for idx, value in enumerate([100, 150, 200]):
+            if min_value <= value <= max_value:
+                y = self.height - 1 - ((value - min_value) / value_range * (self.height - 2) + 1)
+                self.draw_horizontal_dashed_line(draw, y, 1, self.width-2, line_dash[idx], line_dash[idx], (0,0,200), 2)
+
+        self.layers[key] = layer
+        if len(self.layers) > self.max_layers:
+            self.layers.popitem(last=False)
+        return layer
 
     def draw_horizontal_dashed_line(self, draw, y, x_start, x_end, dash_length=10, gap_length=5, fill=(255,255,255), width=2):
         """
@@ -30,36 +91,49 @@ class DrawGraph:
             # 空白部分をスキップ
             current_x += dash_length + gap_length
 
-    def create_graph(self, data):
+    def draw_dotted_line(self, start, end, radius=2):
+        """start から end まで点線（間隔 forecast_dot_gap の点）を描く"""
+        length = math.hypot(end[0] - start[0], end[1] - start[1])
+        steps = max(int(length // self.forecast_dot_gap), 1)
+        for i in range(1, steps + 1):
+            x = start[0] + (end[0] - start[0]) * i / steps
+            y = start[1] + (end[1] - start[1]) * i / steps
+            self.draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=self.forecast_color)
+
+    def create_graph(self, timestamps, values, forecast=None):
         """
         データポイントからグラフを生成する
         
         Args:
-            data: (unix_timestamp, value)のタプルのリスト
-            width: グラフの幅（ピクセル）
-            height: グラフの高さ（ピクセル）
+            timestamps: unix_timestampの配列（DataStoreのビュー、古い順）
+            values: 値の配列（timestampsと同じ長さ）
+            forecast: 予測線の始点と終点 ((timestamp, value), (timestamp, value))。
+                      あれば横軸を終点まで伸ばし、点線で描く
             
         Returns:
             PIL Image オブジェクト
         """
-        # グラフの背景をクリア
-        self.draw.rectangle([0, 0, self.width-1, self.height-1], fill=self.bg_color)
+        # データが前回と同じなら前回の画像をそのまま返す
+        if (self.drawn_data is not None
+                and np.array_equal(self.drawn_data[0], timestamps)
+                and np.array_equal(self.drawn_data[1], values)
+                and self.drawn_data[2] == forecast):
+            return self.image
+        self.drawn_data = (timestamps.copy(), values.copy(), forecast)
 
-        # 外側の枠線を描画
-        #self.draw.rectangle([0, 0, self.width-1, self.height-1], outline=self.box_color)
-        
-        # データから値を取得
-        timestamps = [point[0] for point in data]  # Unix時間（秒）を直接使用
-        values = [point[1] for point in data]
-        
         # 時間の範囲を計算
-        time_min = min(timestamps)
-        time_max = max(timestamps)
+        time_min = int(timestamps.min())
+        time_max = int(timestamps.max())
+        if forecast is not None:
+            time_max = max(time_max, forecast[1][0])
         time_range = time_max - time_min if time_max != time_min else 1
         
         # 値の範囲を計算（最低範囲を100とする）
-        base_min = min(values)
-        base_max = max(values)
+        base_min = int(values.min())
+        base_max = int(values.max())
+        if forecast is not None:
+            base_min = min(base_min, forecast[1][1])
+            base_max = max(base_max, forecast[1][1])
         value_range = max(base_max - base_min, self.height)  # 最低範囲を100に設定
         
         if base_min - (value_range - (base_max - base_min)) / 2 < 0:
@@ -72,23 +146,62 @@ class DrawGraph:
             min_value = center - (value_range / 2)
             max_value = center + (value_range / 2)
 
-        # 100と200の補助線を引く
-        line_dash = [2, 5, 2]
-        for idx, value in enumerate([100, 150, 200]):
-            if min_value <= value <= max_value:
-                y = self.height - 1 - ((value - min_value) / value_range * (self.height - 2) + 1)
-                self.draw_horizontal_dashed_line(self.draw, y, 1, self.width-2, line_dash[idx], line_dash[idx], (0,0,200), 2)
-        
-        # データポイントをプロット
-        points = []
-        for timestamp, value in data:
-            x = ((timestamp - time_min) / time_range * (self.width - 2)) + 1
-            y = self.height - 1 - ((value - min_value) / value_range * (self.height - 2) + 1)
-            points.append((x, y))
-        
+        # 背景と補助線（キャッシュ）を貼り付ける
+        self.image.paste(self.background(min_value, max_value, value_range))
+
+        # データポイントの座標を計算（配列でまとめて計算）
+        x = (timestamps - time_min) / time_range * (self.width - 2) + 1
+        y = self.height - 1 - ((values - min_value) / value_range * (self.height - 2) + 1)
+
+        # 点がピクセル数より多い場合は列ごとの最小・最大に間引く
+        if len(x) > (self.width - 2) * 2:
+            x, y = downsample_minmax(x, y)
+
         # ポイントを線で接続
-        if len(points) > 1:
-            self.draw.line(points, fill='green', width=5)
+        if len(x) > 1:
+            self.draw.line(np.column_stack((x, y)).ravel().tolist(), fill='green', width=5)
+
+        # 予測線
+        if forecast is not None:
+            points = [
+                (
+                    (t - time_min) / time_range * (self.width - 2) + 1,
+                    self.height - 1 - ((v - min_value) / value_range * (self.height - 2) + 1),
+                )
+                for t, v in forecast
+            ]
+            self.draw_dotted_line(*points)
         
         return self.image
 
+    def create_agp(self, bands, min_value=40, max_value=300):
+        """
+        AGP（時間帯ごとの百分位の帯）を描く
+
+        Args:
+            bands: (24, 5) の配列。各時間帯の 10/25/50/75/90 パーセンタイル（データなしは nan）
+            min_value: 縦軸の最小値
+            max_value: 縦軸の最大値（超える値は上端に描く）
+
+        Returns:
+            PIL Image オブジェクト
+        """
+        self.drawn_data = None  # create_graph() で描き直す
+        value_range = max_value - min_value
+        self.image.paste(self.background(min_value, max_value, value_range))
+
+        x = (np.arange(24) + 0.5) / 24 * (self.width - 2) + 1
+        clipped = np.clip(bands, min_value, max_value)
+        y = self.height - 1 - ((clipped - min_value) / value_range * (self.height - 2) + 1)
+        # 隣り合う時間帯が両方ともデータのある区間だけを台形でつなぐ
+        for h in range(23):
+            if np.isnan(bands[h]).any() or np.isnan(bands[h + 1]).any():
+                continue
+            for low, high, color in ((0, 4, (0, 70, 0)), (1, 3, (0, 140, 0))):
+                self.draw.polygon(
+                    [(x[h], y[h, low]), (x[h + 1], y[h + 1, low]),
+                     (x[h + 1], y[h + 1, high]), (x[h], y[h, high])],
+                    fill=color,
+                )
+            self.draw.line([(x[h], y[h, 2]), (x[h + 1], y[h + 1, 2])], fill=(0, 255, 0), width=3)
+        return self.image
@@ -1,20 +1,213 @@
+import fcntl
 import mmap
+import os
+import stat
+import struct
+
+import numpy as np
+
+# RGB画像のチャンネル位置
+_CHANNEL_INDEX = {'R': 0, 'G': 1, 'B': 2}
+
+# linux/fb.h
+FBIOGET_VSCREENINFO = 0x4600
+FBIOGET_FSCREENINFO = 0x4602
+# fb_var_screeninfo の先頭（xres ... transp の bitfield まで）
+_VAR_SCREENINFO = struct.Struct('=8I12I')
+# fb_fix_screeninfo の先頭（id ... line_length まで、ネイティブのアラインメント）
+_FIX_SCREENINFO = struct.Struct('@16sLIIIIHHHI')
+
+# ビット深度ごとの既定のピクセル形式（オフセットが取得できない場合）
+DEFAULT_LAYOUTS = {16: 'RGB565', 24: 'BGR', 32: 'BGRA'}
+
+
+class PixelConverter:
+    """PIL画像をフレームバッファのピクセル並びに変換するクラス
+
+    layout はメモリ上のバイト順（例: 'BGRA', 'BGRX', 'RGBA', 'RGB'）。
+    'A' と 'X' のバイトは 255 で埋める。
+    変換はNumPyのチャンネル単位の代入で行い、ピクセル単位のループは使わない。
+    """
+
+    def __init__(self, layout='BGRA'):
+        for ch in layout:
+            if ch not in _CHANNEL_INDEX and ch not in 'AX':
+                raise ValueError(f"未対応のピクセル形式です: {layout}")
+        self.layout = layout
+        self.bytes_per_pixel = len(layout)
+
+    def view(self, buffer, width, height, line_length):
+        """バッファ上の height x width x bytes_per_pixel のビューを返す"""
+        return np.ndarray(
+            (height, width, self.bytes_per_pixel), np.uint8, buffer,
+            strides=(line_length, self.bytes_per_pixel, 1),
+        )
+
+    def convert_into(self, img, dst):
+        """画像を変換して dst（view() の戻り値）へ直接書き込む"""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        src = np.asarray(img)
+        for i, ch in enumerate(self.layout):
+            if ch in _CHANNEL_INDEX:
+                dst[..., i] = src[..., _CHANNEL_INDEX[ch]]
+            else:
+                dst[..., i] = 255
+
+
+class PackedPixelConverter:
+    """PIL画像を16bitのパック形式（RGB565など）に変換するクラス
+
+    fields は R, G, B それぞれの (ビットオフセット, ビット長)。
+    """
+
+    def __init__(self, fields, layout=''):
+        self.fields = fields
+        self.layout = layout
+        self.bytes_per_pixel = 2
+        self._acc = None  # 作業用バッファ（足りなくなるまで再利用）
+        self._tmp = None
+
+    def view(self, buffer, width, height, line_length):
+        """バッファ上の height x width のビュー（リトルエンディアン16bit）を返す"""
+        return np.ndarray((height, width), '<u2', buffer, strides=(line_length, 2))
+
+    def convert_into(self, img, dst):
+        """画像を変換して dst（view() の戻り値）へ書き込む"""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        src = np.asarray(img)
+        if self._acc is None or self._acc.size < dst.size:
+            self._acc = np.empty(dst.size, np.uint16)
+            self._tmp = np.empty(dst.size, np.uint16)
+        acc = self._acc[:dst.size].reshape(dst.shape)
+        tmp = self._tmp[:dst.size].reshape(dst.shape)
+        acc.fill(0)
+        for idx, (offset, length) in enumerate(self.fields):
+            np.right_shift(src[..., idx], 8 - length, out=tmp)
+            np.left_shift(tmp, offset, out=tmp)
+            np.bitwise_or(acc, tmp, out=acc)
+        dst[...] = acc
+
+
+def create_converter(layout):
+    """ピクセル形式名から変換クラスを生成する"""
+    if layout == 'RGB565':
+        return PackedPixelConverter(((11, 5), (5, 6), (0, 5)), layout)
+    if layout == 'BGR565':
+        return PackedPixelConverter(((0, 5), (5, 6), (11, 5)), layout)
+    return PixelConverter(layout)
+
+
+def layout_from_bitfields(bits_per_pixel, red, green, blue, transp):
+    """fb_var_screeninfo の (offset, length) からピクセル形式名を求める"""
+    if bits_per_pixel == 16:
+        if (red[1], green[1], blue[1]) != (5, 6, 5):
+            raise ValueError(f"未対応の16bit形式です: {red} {green} {blue}")
+        return 'RGB565' if red[0] > blue[0] else 'BGR565'
+    if bits_per_pixel in (24, 32):
+        chars = ['X'] * (bits_per_pixel // 8)
+        for ch, (offset, length) in (('R', red), ('G', green), ('B', blue), ('A', transp)):
+            if length:
+                chars[offset // 8] = ch
+        return ''.join(chars)
+    raise ValueError(f"未対応のビット深度です: {bits_per_pixel}")
+
+
+def merge_row_spans(boxes, height):
+    """矩形 (x0, y0, x1, y1) のリストを、重なりをまとめた行範囲 (y0, y1) のリストにする"""
+    spans = []
+    for _, y0, _, y1 in sorted(boxes, key=lambda box: box[1]):
+        y0, y1 = max(0, int(y0)), min(height, int(y1))
+        if y0 >= y1:
+            continue
+        if spans and y0 <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], y1))
+        else:
+            spans.append((y0, y1))
+    return spans
+
 
 class Framebuffer:
-    """フレームバッファクラス"""
-    
-    def __init__(self, width=480, height=320):
+    """フレームバッファクラス
+
+    open() でデバイスの解像度・ビット深度・チャンネル配置・ライン長を
+    ioctl（取れなければ sysfs）から読み取り、対応する変換クラスを選ぶ。
+    通常ファイルを device に指定した場合は、コンストラクタの値をそのまま使う
+    （ハードウェアのない環境でのテスト用）。
+    """
+
+    SYSFS_DIR = '/sys/class/graphics'
+
+    def __init__(self, width=480, height=320, device='/dev/fb0', layout=None,
+                 bits_per_pixel=32, line_length=None):
         self.width = width
         self.height = height
+        self.device = device
+        self.bits_per_pixel = bits_per_pixel
+        self.line_length = line_length
+        self.layout = layout  # None の場合は自動検出
+        self.converter = None
         self.fb_file = None
         self.fb = None
-    
+        self.pixels = None  # mmap上のNumPyビュー（変換結果の書き込み先）
+
     def open(self):
         """フレームバッファを開く"""
-        self.fb_file = open('/dev/fb0', 'r+b')
-        self.fb = mmap.mmap(self.fb_file.fileno(), self.width * self.height * 4)
+        self.fb_file = open(self.device, 'r+b')
+        detected_layout = None
+        # 画面情報はデバイスの場合だけ読む（通常ファイルは名前が fb0 等でも検出しない）
+        if stat.S_ISCHR(os.fstat(self.fb_file.fileno()).st_mode):
+            detected_layout = self._detect_ioctl() or self._detect_sysfs()
+        layout = self.layout or detected_layout or DEFAULT_LAYOUTS[self.bits_per_pixel]
+        self.converter = create_converter(layout)
+        self.layout = layout
+        bpp = self.converter.bytes_per_pixel
+        if not self.line_length:
+            self.line_length = self.width * bpp
+
+        self.fb = mmap.mmap(self.fb_file.fileno(), self.line_length * self.height)
+        self.pixels = self.converter.view(self.fb, self.width, self.height, self.line_length)
+
+    def _detect_ioctl(self):
+        """ioctl で画面情報を取得する。取得できればピクセル形式名を返す"""
+        try:
+            var = bytearray(160)
+            fix = bytearray(80)
+            fcntl.ioctl(self.fb_file.fileno(), FBIOGET_VSCREENINFO, var)
+            fcntl.ioctl(self.fb_file.fileno(), FBIOGET_FSCREENINFO, fix)
+        except OSError:
+            return None
+        v = _VAR_SCREENINFO.unpack_from(var)
+        f = _FIX_SCREENINFO.unpack_from(fix)
+        self.width, self.height, self.bits_per_pixel = v[0], v[1], v[6]
+        self.line_length = f[-1]
+        red, green, blue, transp = (tuple(v[i:i + 2]) for i in range(8, 20, 3))
+        return layout_from_bitfields(self.bits_per_pixel, red, green, blue, transp)
+
+    def _detect_sysfs(self):
+        """sysfs から解像度・ビット深度・ストライドを取得する"""
+        name = os.path.basename(os.path.realpath(self.device))
+        path = os.path.join(self.SYSFS_DIR, name)
+        if not os.path.isdir(path):
+            return None
+
+        def read(attr):
+            with open(os.path.join(path, attr)) as f:
+                return f.read().strip()
+
+        try:
+            # virtual_size はダブルバッファ分を含むことがあるため高さは使わない
+            self.width = int(read('virtual_size').split(',')[0])
+            self.bits_per_pixel = int(read('bits_per_pixel'))
+            self.line_length = int(read('stride'))
+        except (OSError, ValueError):
+            return None
+        return DEFAULT_LAYOUTS.get(self.bits_per_pixel)
 
     def close(self):
+        # ビューを先に解放しないと mmap を閉じられない
+        self.pixels = None
         if self.fb:
             self.fb.close()
             self.fb = None
@@ -22,16 +215,29 @@ class Framebuffer:
             self.fb_file.close()
             self.fb_file = None
 
-    def write_image(self, img):
-        """PIL画像をフレームバッファに書き込み"""
-        # RGBAモードに変換
-        rgba_img = img.convert('RGBA')
-        rgba_data = rgba_img.tobytes()
-        
-        # RGBAからBGRAに変換（R <-> B を交換）
-        bgra_data = bytearray(rgba_data)
-        for i in range(0, len(bgra_data), 4):
-            bgra_data[i], bgra_data[i + 2] = bgra_data[i + 2], bgra_data[i]
-        
-        # フレームバッファに書き込み
-        self.fb[:] = bgra_data
+    def snapshot(self):
+        """フレームバッファの内容（デバイスのピクセル形式のまま）を返す"""
+        return bytes(self.fb)
+
+    def restore(self, data):
+        """snapshot() の内容を書き戻す。大きさが合わなければ何もせず False"""
+        if len(data) != len(self.fb):
+            return False
+        self.fb[:] = data
+        return True
+
+    def write_image(self, img, boxes=None):
+        """PIL画像をフレームバッファに書き込み
+
+        boxes に変更された矩形のリストを渡すと、それを含む行範囲だけを書き換える。
+        """
+        # mmap上のビューへ直接変換するため、フレーム毎の中間バッファは作らない
+        if boxes is None:
+            if img.size != (self.width, self.height):
+                img = img.crop((0, 0, self.width, self.height))
+            self.converter.convert_into(img, self.pixels)
+            return
+
+        for y0, y1 in merge_row_spans(boxes, self.height):
+            span = img.crop((0, y0, self.width, y1))
+            self.converter.convert_into(span, self.pixels[y0:y1])
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    """1つの処理段階の所要時間（直近 window 回分と、累計の回数・合計・最大）"""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        """直近の p50 / p95 / max と累計（lifetime_max は起動からの最大）を返す"""
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": self.count, "sum": self.total, "lifetime_max": self.max,
+                    "p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "lifetime_max": self.max,
+            "p50": samples[int(len(samples) * 0.50)],
+            "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+            "max": samples[-1],
+        }
+
+
+class Metrics:
+    """処理段階ごとの所要時間を集計するクラス
+
+    with metrics.stage("graph"): ... のように計測し、summary() で
+    直近 window 回の p50 / p95 / max を取得する。複数のスレッドから使える。
+    """
+
+    def __init__(self, window=300):
+        self.window = window
+        self.stages = {}  # 名前 -> StageStats（登録順）
+        self.counters = {}  # 名前 -> 回数（エラー等）
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        """所要時間（秒）を記録"""
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats(self.window)
+            stats.add(seconds)
+
+    def count(self, name, value=1):
+        """回数（エラー等）を加算"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, name):
+        """with ブロックの所要時間を name として記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def summary(self):
+        """{段階名: {count, sum, lifetime_max, p50, p95, max}}"""
+        with self.lock:
+            return {name: stats.summary() for name, stats in self.stages.items()}
+
+    def format_summary(self):
+        """ログ用の1行の文字列"""
+        with self.lock:
+            counters = dict(self.counters)
+        return " ".join(
+            [
+                f"{name}=p50:{s['p50'] * 1000:.1f}/p95:{s['p95'] * 1000:.1f}"
+                f"/max:{s['max'] * 1000:.1f}ms(n={s['count']})"
+                for name, s in self.summary().items()
+            ]
+            + [f"{name}={value}" for name, value in counters.items()]
+        )
+
+    def prometheus_text(self, prefix="sgvmon"):
+        """Prometheus のテキスト形式（summary 型 + 最大値）"""
+        name = f"{prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Processing time of each stage.",
+            f"# TYPE {name} summary",
+        ]
+        max_lines = [
+            f"# HELP {name}_max Max processing time in the recent window.",
+            f"# TYPE {name}_max gauge",
+        ]
+        lifetime_lines = [
+            f"# HELP {name}_lifetime_max Max processing time since start.",
+            f"# TYPE {name}_lifetime_max gauge",
+        ]
+        for stage, s in self.summary().items():
+            label = f'stage="{stage}"'
+            lines.append(f'{name}{{{label},quantile="0.5"}} {s["p50"]:.6f}')
+            lines.append(f'{name}{{{label},quantile="0.95"}} {s["p95"]:.6f}')
+            lines.append(f"{name}_sum{{{label}}} {s['sum']:.6f}")
+            lines.append(f"{name}_count{{{label}}} {s['count']}")
+            max_lines.append(f"{name}_max{{{label}}} {s['max']:.6f}")
+            lifetime_lines.append(f"{name}_lifetime_max{{{label}}} {s['lifetime_max']:.6f}")
+        with self.lock:
+            counters = dict(self.counters)
+        counter_lines = [
+            f"# HELP {prefix}_events_total Number of events such as errors.",
+            f"# TYPE {prefix}_events_total counter",
+        ] + [f'{prefix}_events_total{{event="{event}"}} {value}' for event, value in counters.items()]
+        return "\n".join(lines + max_lines + lifetime_lines + counter_lines) + "\n"
+
+
+class PhaseTimer:
+    """起動処理のように1回だけ行う処理の、段階ごとの所要時間"""
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.phases = {}  # 名前 -> 秒（登録順）
+
+    @contextmanager
+    def phase(self, name):
+        """with ブロックの所要時間を name として記録（別スレッドからも使える）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def mark(self, name):
+        """start からの経過時間を name として記録"""
+        self.phases[name] = time.perf_counter() - self.start
+
+    def format(self):
+        """ログ用の1行の文字列"""
+        return " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+
+
+class MetricsServer:
+    """/metrics で Metrics を Prometheus 形式で返す HTTP サーバ（別スレッド）"""
+
+    def __init__(self, metrics, host="127.0.0.1", port=9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name="metrics", daemon=True
+        )
+        self.thread.start()
+        logger.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import http.client
+import json
+import logging
+import threading
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+ENTRIES_PATH = '/api/v1/entries/sgv.json'  # /api/v1/entries のうち sgv のもの
+
+
+class NightscoutError(Exception):
+    """Nightscout が 200 / 304 以外を返した"""
+
+
+class NightscoutClient:
+    """Nightscout の REST API（/api/v1/entries）のクライアント
+
+    1本の接続を使い回し（keep-alive）、応答は gzip で受け取る。
+    前回と同じ問い合わせには ETag / Last-Modified を付け、内容が変わっていなければ
+    304（本文なし）で済ませて前回の結果を返す。複数のスレッドから使える。
+    """
+
+    def __init__(self, url, token=None, api_secret=None, timeout=10.0):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Nightscout の URL が正しくありません: {url}")
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self.headers = {
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip',
+            'User-Agent': 'sgvmon',
+        }
+        if api_secret:  # API_SECRET は SHA-1 のハッシュで送る
+            self.headers['api-secret'] = hashlib.sha1(api_secret.encode()).hexdigest()
+        self.conn = None
+        self.lock = threading.Lock()
+        self.cached = None  # 前回の (url, etag, last_modified, data)
+        # 統計
+        self.requests = 0
+        self.not_modified = 0
+        self.connections = 0
+        self.bytes_received = 0
+
+    def entries_since(self, last_date=None, count=50):
+        """
+        last_date より新しい SGV エントリを新しい順に返す
+        :param last_date: 日時（ミリ秒）。None なら最新から count 件
+        :param count: 最大件数
+        :return: エントリ（dict）のリスト
+        """
+        params = {'count': count}
+        if last_date:
+            params['find[date][$gt]'] = int(last_date)
+        return self.get_json(ENTRIES_PATH, params)
+
+    def get_json(self, path, params):
+        """GET して JSON を返す（変化がなければ前回の結果）"""
+        if self.token:
+            params = dict(params, token=self.token)
+        url = f"{self.base_path}{path}?{urllib.parse.urlencode(params)}"
+        headers = dict(self.headers)
+        cached = self.cached if self.cached and self.cached[0] == url else None
+        if cached:
+            if cached[1]:
+                headers['If-None-Match'] = cached[1]
+            if cached[2]:
+                headers['If-Modified-Since'] = cached[2]
+
+        status, response_headers, body = self._request(url, headers)
+        if status == 304 and cached:
+            self.not_modified += 1
+            return cached[3]
+        if status != 200:
+            raise NightscoutError(f"HTTP {status}: {body[:200]!r}")
+        if response_headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        data = json.loads(body)
+        self.cached = (url, response_headers.get('ETag'),
+                       response_headers.get('Last-Modified'), data)
+        return data
+
+    def _connect(self):
+        if self.https:
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self.connections += 1
+        return conn
+
+    def _request(self, url, headers):
+        """(status, headers, body) を返す。使い回した接続が切れていた場合は1回だけ繋ぎ直す"""
+        with self.lock:
+            for retry in (False, True):
+                reused = self.conn is not None
+                if not reused:
+                    self.conn = self._connect()
+                try:
+                    self.conn.request('GET', url, headers=headers)
+                    response = self.conn.getresponse()
+                    body = response.read()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    self.close_connection()
+                    if reused and not retry:  # サーバーが keep-alive の接続を閉じていた
+                        continue
+                    raise
+                except Exception:
+                    self.close_connection()
+                    raise
+                self.requests += 1
+                self.bytes_received += len(body)
+                if response.will_close:
+                    self.close_connection()
+                return response.status, response.headers, body
+
+    def close_connection(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def close(self):
+        with self.lock:
+            self.close_connection()
+
+    def stats(self):
+        """通信の統計を返す"""
+        return {
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+            'connections': self.connections,
+            'bytes_received': self.bytes_received,
+        }
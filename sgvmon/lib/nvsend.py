@@ -1,17 +1,148 @@
+import base64
+import hashlib
 import logging
 import io
+import selectors
 import socket
 import struct
+import threading
+import time
+import zlib
+
+import numpy as np
 from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+# タイル差分フレームのヘッダ（マジック, 種別, 幅, 高さ, タイルサイズ, タイル数）
+TILE_MAGIC = b'NVT'
+TILE_HEADER = struct.Struct('!3sBHHHH')
+FRAME_KEY = 0  # キーフレーム（画像全体）
+FRAME_DELTA = 1  # 差分フレーム（変化したタイルのみ）
+
+
+class TileEncoder:
+    """画像をタイル差分形式にエンコードするクラス
+
+    keyframe_interval フレームごと（と接続直後）に画像全体を送り、
+    その間は前フレームから変化した tile_size 四方のタイルだけを送る。
+    画素データは生のRGBを zlib（既定は最速のレベル1）で圧縮する。
+    """
+
+    def __init__(self, tile_size=32, keyframe_interval=60, level=1):
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self.prev = None  # 前フレーム（NumPy配列）
+        self.since_keyframe = 0
+
+    def force_keyframe(self):
+        """次のフレームをキーフレームにする（再接続時など）"""
+        self.prev = None
+
+    def changed_tiles(self, cur):
+        """前フレームから変化したタイルの (行, 列) インデックスを返す"""
+        t = self.tile_size
+        h, w = cur.shape[:2]
+        # バイト単位で比較し、タイルの行方向 → 列方向の順に畳み込む
+        diff = (cur != self.prev).view(np.uint8).reshape(h, w * 3)
+        diff = np.pad(diff, ((0, -h % t), (0, -w % t * 3)))
+        rows = np.bitwise_or.reduce(diff.reshape(diff.shape[0] // t, t, -1), axis=1)
+        tiles = rows.reshape(rows.shape[0], -1, t * 3).any(axis=2)
+        return np.nonzero(tiles)
+
+    def encode_keyframe(self, img, out):
+        """画像全体をキーフレームとして書き込む（差分の基準は更新しない）"""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        w, h = img.size
+        out.write(TILE_HEADER.pack(TILE_MAGIC, FRAME_KEY, w, h, self.tile_size, 0))
+        out.write(zlib.compress(img.tobytes(), self.level))
+
+    def encode(self, img, out):
+        """画像をエンコードして out（ファイルライクオブジェクト）に書き込む"""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        cur = np.asarray(img)
+        h, w = cur.shape[:2]
+        t = self.tile_size
+
+        if (self.prev is None or self.prev.shape != cur.shape
+                or self.since_keyframe >= self.keyframe_interval):
+            self.encode_keyframe(img, out)
+            self.prev = cur
+            self.since_keyframe = 1
+            return
+
+        rows, cols = self.changed_tiles(cur)
+        index = np.empty((len(rows), 2), '>u2')
+        index[:, 0] = rows
+        index[:, 1] = cols
+        pixels = b''.join(
+            cur[y * t:(y + 1) * t, x * t:(x + 1) * t].tobytes() for y, x in zip(rows, cols)
+        )
+        out.write(TILE_HEADER.pack(TILE_MAGIC, FRAME_DELTA, w, h, t, len(rows)))
+        out.write(index.tobytes())
+        out.write(zlib.compress(pixels, self.level))
+        self.prev = cur
+        self.since_keyframe += 1
+
+
+class FrameDecoder:
+    """受信したフレーム（PNG またはタイル差分形式）を画像に戻すクラス"""
+
+    def __init__(self):
+        self.frame = None  # 復元中の画像（NumPy配列）
+
+    def decode(self, data):
+        """フレームのデータから PIL 画像を返す"""
+        if data[:len(TILE_MAGIC)] != TILE_MAGIC:
+            return Image.open(io.BytesIO(data))
+
+        _, frame_type, w, h, t, count = TILE_HEADER.unpack_from(data)
+        body = memoryview(data)[TILE_HEADER.size:]
+        if frame_type == FRAME_KEY:
+            pixels = zlib.decompress(body)
+            self.frame = np.frombuffer(pixels, np.uint8).reshape(h, w, 3).copy()
+        else:
+            if self.frame is None or self.frame.shape != (h, w, 3):
+                raise ValueError("キーフレームを受信する前に差分フレームを受信しました")
+            index = np.frombuffer(body[:count * 4], '>u2').reshape(count, 2)
+            pixels = zlib.decompress(body[count * 4:])
+            offset = 0
+            for y, x in index.tolist():
+                tile = self.frame[y * t:(y + 1) * t, x * t:(x + 1) * t]
+                tile[...] = np.frombuffer(pixels, np.uint8, tile.size, offset).reshape(tile.shape)
+                offset += tile.size
+        return Image.frombytes('RGB', (w, h), self.frame.tobytes())
+
+
 class ImageSender:
-    def __init__(self, host='localhost', port=49011):
+    """画像をPNGにしてNetViewサーバーへ送信するクラス
+
+    送信データは 4バイトのサイズ（ネットワークバイトオーダー）+ PNG データ。
+    encoding='tile' の場合は PNG の代わりにタイル差分形式（TileEncoder）で送る。
+    persistent=True の場合は接続を維持し、1本の接続で複数のフレームを送る。
+    接続に失敗した場合は backoff 秒（失敗の度に倍、最大 max_backoff 秒）待ってから再接続する。
+    """
+
+    def __init__(self, host='localhost', port=49011, persistent=False,
+                 timeout=3.0, backoff=1.0, max_backoff=30.0, encoding='png',
+                 metrics=None):
         self.host = host
         self.port = port
+        self.persistent = persistent
+        self.metrics = metrics  # 所要時間の記録先（metrics.Metrics、任意）
+        self.encoder = TileEncoder() if encoding == 'tile' else None
+        self.timeout = timeout
+        self.min_backoff = backoff
+        self.max_backoff = max_backoff
+        self.backoff = backoff
+        self.retry_at = 0  # 次に接続を試みる時刻
+        self.sock = None
+        self.frame = io.BytesIO()  # 送信フレームの組み立て用（使い回す）
         logger.debug("Initializing NetView")
-        logger.debug(f"host={host}:{port}")
+        logger.debug(f"host={host}:{port} persistent={persistent}")
 
     def send_image_from_file(self, image_path):
         """画像ファイルを読み込んでサーバーに送信"""
@@ -23,92 +154,920 @@ class ImageSender:
         except FileNotFoundError:
             logger.error(f"エラー: 画像ファイル '{image_path}' が見つかりません")
 
+    def encode_frame(self, img):
+        """サイズヘッダ付きのフレームを組み立て、memoryview を返す"""
+        frame = self.frame
+        frame.seek(0)
+        frame.truncate()
+        frame.write(b'\0\0\0\0')
+        if self.encoder is not None:
+            self.encoder.encode(img, frame)
+        else:
+            img.save(frame, format='PNG')
+        size = frame.tell() - 4
+        frame.seek(0)
+        frame.write(struct.pack('!I', size))
+        return frame.getbuffer()
+
+    def connect(self):
+        """サーバーに接続する。失敗した場合は None を返し、再接続を遅らせる"""
+        if time.monotonic() < self.retry_at:
+            return None
+        try:
+            logger.debug(f"Connecting Server {self.host}:{self.port} ...")
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except ConnectionRefusedError:
+            logger.error(f"接続が拒否されました: {self.host}:{self.port}")
+        except socket.gaierror:
+            logger.error(f"ホスト名の解決に失敗しました: {self.host}")
+        except Exception as e:
+            logger.error(f"接続エラー: {str(e)}")
+        else:
+            self.backoff = self.min_backoff
+            if self.encoder is not None:
+                # 受信側は前のフレームを持っていないので画像全体から送る
+                self.encoder.force_keyframe()
+            return sock
+
+        self.retry_at = time.monotonic() + self.backoff
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+        return None
+
+    def close(self):
+        """接続を閉じる"""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except Exception as e:
+                logger.error(f"ソケットクローズエラー: {str(e)}")
+            self.sock = None
+
     def send_image(self, img):
-        """画像イメージ(PIL)をサーバーに送信"""
+        """画像イメージ(PIL)をサーバーに送信。送信できた場合は True を返す"""
         if not self.host:
-            return
-        sock = None
+            return False
         try:
-            # Imageオブジェクトをバイナリデータに変換
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
+            if self.sock is None:
+                self.sock = self.connect()
+                if self.sock is None:
+                    return False
 
-            # サーバーに接続
+            start = time.perf_counter()
+            data = self.encode_frame(img)
+            encoded = time.perf_counter()
+            logger.debug(f"Image Size: {len(data) - 4} bytes")
             try:
-                logger.debug(f"Connecting Server {self.host}:{self.port} ...")
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.connect((self.host, self.port))
-            except ConnectionRefusedError:
-                logger.error(f"接続が拒否されました: {self.host}:{self.port}")
-                return
-            except socket.gaierror:
-                logger.error(f"ホスト名の解決に失敗しました: {self.host}")
+                self.sock.sendall(data)
+            finally:
+                data.release()
+            if self.metrics is not None:
+                self.metrics.observe("netview_encode", encoded - start)
+                self.metrics.observe("netview_send", time.perf_counter() - encoded)
+            logger.debug("Transmission completed")
+            return True
+
+        except Exception as e:
+            logger.error(f"送信エラー: {str(e)}")
+            self.close()
+            return False
+        finally:
+            if not self.persistent:
+                self.close()
+
+
+class _SendWorker:
+    """BackgroundSender の送信先1つ分（専用のスレッドと1枚分の受け渡し領域）"""
+
+    def __init__(self, sender):
+        self.sender = sender
+        self.cond = threading.Condition()
+        self.pending = None  # 未送信の最新画像
+        self.running = False
+        self.thread = None
+        # 統計
+        self.frames_sent = 0
+        self.frames_failed = 0
+        self.frames_dropped = 0
+        self.last_latency = 0.0  # 直近の送信時間（秒）
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run, name=f"nvsend-{type(self.sender).__name__}", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        """停止を指示する（残っている画像は送ってから終了する）"""
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def put(self, frame):
+        with self.cond:
+            if self.pending is not None:
+                self.frames_dropped += 1
+            self.pending = frame
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and self.pending is None:
+                    self.cond.wait()
+                if self.pending is None:  # 停止時も残っている画像は送ってから終了
+                    return
+                frame, self.pending = self.pending, None
+
+            start = time.perf_counter()
+            ok = self._send(frame)
+            latency = time.perf_counter() - start
+            with self.cond:
+                if ok:
+                    self.frames_sent += 1
+                else:
+                    self.frames_failed += 1
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+                self.total_latency += latency
+
+    def _send(self, frame):
+        """送信先へ送る（例外で送信スレッドを止めない）"""
+        try:
+            return self.sender.send_image(frame)
+        except Exception:
+            logger.exception(f"送信に失敗しました: {type(self.sender).__name__}")
+            return False
+
+    def stats(self):
+        with self.cond:
+            return {
+                "target": type(self.sender).__name__,
+                "sent": self.frames_sent,
+                "failed": self.frames_failed,
+                "dropped": self.frames_dropped,
+                "last_latency": self.last_latency,
+                "max_latency": self.max_latency,
+                "total_latency": self.total_latency,
+            }
+
+
+class BackgroundSender:
+    """ImageSender の送信を専用スレッドで行うクラス
+
+    send_image() は画像を1枚分の受け渡し領域に置くだけで、すぐに戻る。
+    送信中に次の画像が来た場合は古い画像を捨て、最新の画像だけを送る。
+    送信先（ImageSender / ImagePublisher）は複数指定でき、送信先ごとのスレッドで送る
+    （接続できない送信先の待ち時間や再試行が、他の送信先を遅らせない）。
+    """
+
+    def __init__(self, *senders):
+        self.workers = [_SendWorker(sender) for sender in senders if sender.host]
+        self.senders = [worker.sender for worker in self.workers]
+        self.host = bool(self.workers)
+        self.running = False
+
+    def start(self):
+        """送信スレッドを開始"""
+        if self.running:
+            return
+        self.running = True
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout=5.0):
+        """送信スレッドを停止して接続を閉じる"""
+        self.running = False
+        for worker in self.workers:
+            worker.stop()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker.thread is not None:
+                worker.thread.join(max(deadline - time.monotonic(), 0))
+                worker.thread = None
+        for sender in self.senders:
+            sender.close()
+
+    def send_image(self, img):
+        """画像を送信待ちにする（描画中の画像が変わらないようコピーを渡す）"""
+        if not self.host:
+            return
+        frame = img.copy()  # 送信先の間で共有する（送信先は画像を書き換えない）
+        for worker in self.workers:
+            worker.put(frame)
+
+    def stats(self):
+        """送信統計を返す（件数は送信先ごとの合計、targets は送信先ごとの統計）"""
+        targets = [worker.stats() for worker in self.workers]
+        sent = sum(t["sent"] for t in targets)
+        failed = sum(t["failed"] for t in targets)
+        count = sent + failed
+        return {
+            "sent": sent,
+            "failed": failed,
+            "dropped": sum(t["dropped"] for t in targets),
+            "last_latency": max((t["last_latency"] for t in targets), default=0.0),
+            "avg_latency": sum(t["total_latency"] for t in targets) / count if count else 0.0,
+            "max_latency": max((t["max_latency"] for t in targets), default=0.0),
+            "targets": [
+                {key: t[key] for key in ("target", "sent", "failed", "dropped", "max_latency")}
+                for t in targets
+            ],
+        }
+
+
+class _Subscriber:
+    """ImagePublisher に接続しているビューア"""
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.out = None  # 送信中のフレーム（memoryview）
+        self.pending = None  # 次に送るフレーム
+        self.synced = False  # 差分フレームをそのまま受け取れる状態か
+        self.sent = 0
+        self.dropped = 0
+
+
+class ImagePublisher:
+    """フレームを1回だけエンコードし、接続してきた複数のビューアへ配信するサーバ
+
+    start() で待ち受けを始めてから、ImageSender と同じく send_image() で画像を渡す。配信は selectors による
+    ノンブロッキングI/Oで別スレッドが行い、ビューアごとに「送信中1枚 + 待ち1枚」
+    だけを保持する。遅いビューアには待ちのフレームを最新のものに置き換えて送る
+    （差分形式の場合はキーフレームに置き換える）ため、他のビューアに影響しない。
+    ビューア側は ImageReceiver(host, port).subscribe_frames() で受信する。
+    """
+
+    def __init__(self, host='0.0.0.0', port=49012, encoding='png', max_clients=8,
+                 metrics=None):
+        self.host = host
+        self.port = port
+        self.metrics = metrics  # 所要時間の記録先（metrics.Metrics、任意）
+        self.encoder = TileEncoder() if encoding == 'tile' else None
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.subscribers = {}  # fileno -> _Subscriber
+        self.image = None  # 最新の画像
+        self.keyframe = None  # 最新の画像のキーフレーム（必要になった時に作る）
+        self.frames_published = 0
+        self.selector = None
+        self.server_sock = None
+        self.wake_r = None
+        self.wake_w = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """待ち受けを開始"""
+        if self.running:
+            return
+        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_sock.bind((self.host, self.port))
+        self.server_sock.listen(self.max_clients)
+        self.server_sock.setblocking(False)
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server_sock, selectors.EVENT_READ, "accept")
+        self.selector.register(self.wake_r, selectors.EVENT_READ, "wake")
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, name="nvpublish", daemon=True)
+        self.thread.start()
+        logger.info(f"Publishing on {self.host}:{self.port}")
+
+    def close(self):
+        """配信を停止し、すべての接続を閉じる"""
+        if not self.running:
+            return
+        self.running = False
+        self._wake()
+        self.thread.join(5.0)
+        for sub in list(self.subscribers.values()):
+            self._remove(sub)
+        self.selector.close()
+        for sock in (self.server_sock, self.wake_r, self.wake_w):
+            sock.close()
+
+    @staticmethod
+    def _build_frame(encode, img):
+        """サイズヘッダ付きのフレームを bytes で返す"""
+        buf = io.BytesIO()
+        buf.write(b'\0\0\0\0')
+        encode(img, buf)
+        size = buf.tell() - 4
+        buf.seek(0)
+        buf.write(struct.pack('!I', size))
+        return buf.getvalue()
+
+    @staticmethod
+    def _encode_png(img, out):
+        img.save(out, format='PNG')
+
+    def _get_keyframe(self):
+        """最新の画像のキーフレームを返す（lock を取得した状態で呼ぶ）"""
+        if self.keyframe is None:
+            self.keyframe = self._build_frame(self.encoder.encode_keyframe, self.image)
+        return self.keyframe
+
+    def send_image(self, img):
+        """画像を1回だけエンコードし、全ビューアの送信待ちに置く（ビューアがいなければ何もしない）"""
+        if not self.running:  # start() 前と close() 後は配信しない
+            return False
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        with self.lock:
+            if not self.subscribers:
+                # 見ている人がいなければエンコードしない（接続時に最新の画像からキーフレームを作る）
+                self.image = img
+                self.keyframe = None
+                self.frames_published += 1
+                if self.encoder is not None:
+                    self.encoder.force_keyframe()
+                return True
+        start = time.perf_counter()
+        if self.encoder is None:
+            frame = self._build_frame(self._encode_png, img)
+        else:
+            frame = self._build_frame(self.encoder.encode, img)
+        if self.metrics is not None:
+            self.metrics.observe("publish_encode", time.perf_counter() - start)
+
+        with self.lock:
+            self.image = img
+            self.keyframe = frame if self.encoder is None else None
+            self.frames_published += 1
+            for sub in self.subscribers.values():
+                if sub.synced and sub.pending is None:
+                    sub.pending = frame
+                    continue
+                # 前のフレームを送りきれていない（または未同期）ので最新の全体画像に置き換える
+                if sub.pending is not None:
+                    sub.dropped += 1
+                sub.pending = self._get_keyframe()
+                sub.synced = True
+        self._wake()
+        return True
+
+    def stats(self):
+        """配信統計を返す"""
+        with self.lock:
+            return {
+                "published": self.frames_published,
+                "subscribers": [
+                    {"addr": sub.addr, "sent": sub.sent, "dropped": sub.dropped}
+                    for sub in self.subscribers.values()
+                ],
+            }
+
+    def _wake(self):
+        try:
+            self.wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # 既に起こしている
+
+    def _serve(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=1.0):
+                if key.data == "accept":
+                    self._accept()
+                elif key.data == "wake":
+                    try:
+                        while self.wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif events & selectors.EVENT_READ:
+                    self._check_closed(key.data)
+            for sub in list(self.subscribers.values()):
+                self._flush(sub)
+
+    def _accept(self):
+        try:
+            sock, addr = self.server_sock.accept()
+        except BlockingIOError:
+            return
+        if len(self.subscribers) >= self.max_clients:
+            logger.warning(f"接続数が上限に達しています: {addr}")
+            sock.close()
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sub = _Subscriber(sock, addr)
+        with self.lock:
+            if self.image is not None:
+                sub.pending = self._get_keyframe()
+                sub.synced = True
+            self.subscribers[sock.fileno()] = sub
+        self.selector.register(sock, selectors.EVENT_READ, sub)
+        logger.info(f"Subscriber connected: {addr}")
+
+    def _check_closed(self, sub):
+        """ビューアからの受信（切断の検出用。受信データは捨てる）"""
+        try:
+            if sub.sock.recv(4096):
                 return
-            except Exception as e:
-                logger.error(f"接続エラー: {str(e)}")
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
+        self._remove(sub)
+
+    def _flush(self, sub):
+        """送れるだけ送り、送り残しがあれば書き込み可能になるのを待つ"""
+        if sub.sock.fileno() not in self.subscribers:
+            return
+        while True:
+            if sub.out is None:
+                with self.lock:
+                    if sub.pending is None:
+                        break
+                    sub.out = memoryview(sub.pending)
+                    sub.pending = None
+            try:
+                sent = sub.sock.send(sub.out)
+            except BlockingIOError:
+                break
+            except OSError:
+                self._remove(sub)
                 return
+            sub.out = sub.out[sent:]
+            if not sub.out:
+                sub.out = None
+                sub.sent += 1
 
-            # データサイズを送信（4バイトのネットワークバイトオーダー）
-            size = len(img_byte_arr)
-            logger.debug(f"Image Size: {size} bytes")
-            sock.send(struct.pack('!I', size))
+        events = selectors.EVENT_READ
+        if sub.out is not None:
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(sub.sock).events != events:
+            self.selector.modify(sub.sock, events, sub)
 
-            # 画像データを送信
-            sent_size = 0
-            while sent_size < size:
-                chunk_size = min(4096, size - sent_size)
-                chunk = img_byte_arr[sent_size:sent_size + chunk_size]
-                sent = sock.send(chunk)
-                sent_size += sent
+    def _remove(self, sub):
+        with self.lock:
+            self.subscribers.pop(sub.sock.fileno(), None)
+        try:
+            self.selector.unregister(sub.sock)
+        except (KeyError, ValueError):
+            pass
+        sub.sock.close()
+        logger.info(f"Subscriber disconnected: {sub.addr}")
 
-                # 進捗表示
-                progress = (sent_size / size) * 100
 
-            logger.debug("Transmission completed")
+class _WebClient(_Subscriber):
+    """WebStreamServer に接続しているブラウザ"""
+
+    def __init__(self, sock, addr):
+        super().__init__(sock, addr)
+        self.kind = "request"  # request（受信中）/ page / mjpeg / ws
+        self.request = bytearray()
+        self.close_after = False  # 送り終えたら切断する（1回だけの応答）
+
+
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_BINARY = 0x2
+WS_CLOSE = 0x8
+MJPEG_BOUNDARY = b'frame'
+MAX_REQUEST = 8192  # HTTP リクエストヘッダの上限（バイト）
+DELTA_RECT = struct.Struct('!HHHHI')  # 差分の矩形 (x, y, 幅, 高さ, PNG のバイト数)
+
+WEB_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>sgvmon</title>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<style>body{margin:0;background:#000}canvas,img{display:block;margin:auto;max-width:100%}</style>
+</head><body><canvas id="view"></canvas><script>
+// WebSocket で差分を受け取り canvas に描く（使えなければ MJPEG を表示する）
+const canvas = document.getElementById('view'), ctx = canvas.getContext('2d');
+let queue = Promise.resolve();
+function fallback() {
+  const img = document.createElement('img');
+  img.src = '/stream.mjpg';
+  canvas.replaceWith(img);
+}
+function apply(buf) {
+  const view = new DataView(buf);
+  let offset = 2, data = 2 + view.getUint16(0) * 12;
+  const draws = [];
+  for (let i = 0; i < view.getUint16(0); i++, offset += 12) {
+    const x = view.getUint16(offset), y = view.getUint16(offset + 2);
+    const w = view.getUint16(offset + 4), h = view.getUint16(offset + 6);
+    const size = view.getUint32(offset + 8);
+    if (x == 0 && y == 0 && (canvas.width != w || canvas.height != h) && i == 0) {
+      canvas.width = w; canvas.height = h;
+    }
+    const png = new Blob([buf.slice(data, data + size)], {type: 'image/png'});
+    draws.push(createImageBitmap(png).then(bmp => ctx.drawImage(bmp, x, y)));
+    data += size;
+  }
+  return Promise.all(draws);
+}
+try {
+  const ws = new WebSocket((location.protocol == 'https:' ? 'wss://' : 'ws://') + location.host + '/ws');
+  ws.binaryType = 'arraybuffer';
+  ws.onmessage = e => { queue = queue.then(() => apply(e.data)); };
+  ws.onerror = fallback;
+} catch (e) {
+  fallback();
+}
+</script></body></html>
+""".encode()
+
+
+def ws_frame(payload, opcode=WS_BINARY):
+    """WebSocket のフレーム（サーバからはマスクなし）"""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def changed_rects(cur, prev, gap=8):
+    """
+    前の画像から変化した領域を矩形のリストで返す
+    変化した行を gap 行までの隙間でまとめ、まとまりごとに変化した列の範囲を取る
+    :return: [(x, y, 幅, 高さ), ...]
+    """
+    if prev is None or prev.shape != cur.shape:
+        return [(0, 0, cur.shape[1], cur.shape[0])]
+    diff = (cur != prev).any(axis=2)
+    rows = np.flatnonzero(diff.any(axis=1))
+    if not len(rows):
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > gap)
+    rects = []
+    for start, end in zip(np.r_[0, breaks + 1], np.r_[breaks, len(rows) - 1]):
+        y0, y1 = rows[start], rows[end] + 1
+        cols = np.flatnonzero(diff[y0:y1].any(axis=0))
+        rects.append((int(cols[0]), int(y0), int(cols[-1] - cols[0] + 1), int(y1 - y0)))
+    return rects
+
+
+class WebStreamServer(ImagePublisher):
+    """表示中の画面をブラウザで見るための HTTP サーバ
+
+    GET /            表示用のページ（WebSocket で受け、使えなければ MJPEG）
+    GET /stream.mjpg multipart/x-mixed-replace の MJPEG
+    GET /frame.jpg   最新の画面1枚
+    GET /ws          WebSocket。変化した矩形だけを PNG で送る（最初は画面全体）
+
+    ImagePublisher と同じく selectors のノンブロッキングI/Oで1本のスレッドが配信し、
+    send_image() ではフレームを形式ごとに1回だけエンコードして全員で共有する。
+    見ている人がいない形式はエンコードせず、接続中でも画面が変わらなければ何も送らない。
+    遅いブラウザには最新のフレーム（WebSocket は画面全体）に置き換えて送る。
+    """
+
+    def __init__(self, host='0.0.0.0', port=49080, quality=80, max_clients=8, metrics=None):
+        super().__init__(host, port, max_clients=max_clients, metrics=metrics)
+        self.quality = quality  # JPEG の品質
+        self.jpeg = None  # 最新の画像の MJPEG の1パート（必要になった時に作る）
+        self.ws_key = None  # 最新の画像の WebSocket のキーフレーム（同上）
+        self.ws_prev = None  # WebSocket で最後に送った画像（差分の基準）
+        self.frames_encoded = 0
+
+    def _encode_jpeg(self, img):
+        start = time.perf_counter()
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=self.quality)
+        jpeg = buf.getvalue()
+        self.frames_encoded += 1
+        if self.metrics is not None:
+            self.metrics.observe("webview_jpeg", time.perf_counter() - start)
+        return (b'--' + MJPEG_BOUNDARY + b'\r\nContent-Type: image/jpeg\r\n'
+                + f'Content-Length: {len(jpeg)}\r\n\r\n'.encode() + jpeg + b'\r\n')
+
+    def _encode_rects(self, img, rects):
+        """矩形ごとに PNG にした WebSocket のメッセージ"""
+        start = time.perf_counter()
+        header = [struct.pack('!H', len(rects))]
+        pngs = []
+        for x, y, w, h in rects:
+            buf = io.BytesIO()
+            img.crop((x, y, x + w, y + h)).save(buf, format='PNG', compress_level=1)
+            pngs.append(buf.getvalue())
+            header.append(DELTA_RECT.pack(x, y, w, h, len(pngs[-1])))
+        self.frames_encoded += 1
+        if self.metrics is not None:
+            self.metrics.observe("webview_png", time.perf_counter() - start)
+        return ws_frame(b''.join(header + pngs))
+
+    def _get_jpeg(self):
+        """最新の画像の MJPEG のパート（lock を取得した状態で呼ぶ）"""
+        if self.jpeg is None:
+            self.jpeg = self._encode_jpeg(self.image)
+        return self.jpeg
+
+    def _get_keyframe(self):
+        """最新の画像全体の WebSocket のメッセージ（lock を取得した状態で呼ぶ）"""
+        if self.ws_key is None:
+            w, h = self.image.size
+            self.ws_key = self._encode_rects(self.image, [(0, 0, w, h)])
+        return self.ws_key
+
+    def send_image(self, img):
+        """画像を見ている人がいる形式だけでエンコードし、全員の送信待ちに置く"""
+        if not self.running:  # start() 前と close() 後は配信しない
+            return False
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        with self.lock:
+            self.image = img
+            self.jpeg = None
+            self.ws_key = None
+            self.frames_published += 1
+            kinds = {sub.kind for sub in self.subscribers.values()}
+
+        jpeg = self._encode_jpeg(img) if "mjpeg" in kinds else None
+        delta = None
+        full = False  # 差分が画面全体（キーフレームとしても使える）
+        if "ws" in kinds:
+            cur = np.asarray(img)
+            rects = changed_rects(cur, self.ws_prev)
+            self.ws_prev = cur
+            if not rects:  # 見た目が同じなら送らない
+                kinds.discard("ws")
+            else:
+                delta = self._encode_rects(img, rects)
+                full = rects == [(0, 0, img.width, img.height)]
+        else:
+            self.ws_prev = None  # 次に WebSocket で送る時は画面全体にする
+        if not kinds & {"mjpeg", "ws"}:
+            return True
+
+        with self.lock:
+            if jpeg is not None:
+                self.jpeg = jpeg
+            if full:
+                self.ws_key = delta
+            for sub in self.subscribers.values():
+                if sub.kind == "mjpeg":
+                    if sub.pending is not None:
+                        sub.dropped += 1
+                    sub.pending = self._get_jpeg()
+                elif sub.kind == "ws" and "ws" in kinds:
+                    if sub.synced and sub.pending is None and delta is not None:
+                        sub.pending = delta
+                        continue
+                    if sub.pending is not None:
+                        sub.dropped += 1
+                    sub.pending = self._get_keyframe()
+                    sub.synced = True
+        self._wake()
+        return True
+
+    def stats(self):
+        """配信統計を返す"""
+        with self.lock:
+            return {
+                "published": self.frames_published,
+                "encoded": self.frames_encoded,
+                "subscribers": [
+                    {"addr": sub.addr, "kind": sub.kind, "sent": sub.sent, "dropped": sub.dropped}
+                    for sub in self.subscribers.values() if sub.kind in ("mjpeg", "ws")
+                ],
+            }
+
+    def _accept(self):
+        try:
+            sock, addr = self.server_sock.accept()
+        except BlockingIOError:
+            return
+        if len(self.subscribers) >= self.max_clients:
+            logger.warning(f"接続数が上限に達しています: {addr}")
+            sock.close()
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sub = _WebClient(sock, addr)
+        with self.lock:
+            self.subscribers[sock.fileno()] = sub
+        self.selector.register(sock, selectors.EVENT_READ, sub)
+
+    def _check_closed(self, sub):
+        """ブラウザからの受信（HTTP リクエスト、WebSocket の close と切断の検出）"""
+        try:
+            data = sub.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._remove(sub)
+        elif sub.kind == "request":
+            sub.request += data
+            if b'\r\n\r\n' in sub.request:
+                self._handle_request(sub)
+            elif len(sub.request) > MAX_REQUEST:
+                self._remove(sub)
+        elif sub.kind == "ws" and data[0] & 0x0F == WS_CLOSE:
+            self._remove(sub)  # ブラウザ側からの切断（他のメッセージは使わないので捨てる）
+
+    def _handle_request(self, sub):
+        lines = bytes(sub.request).split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        path = parts[1].split('?', 1)[0] if len(parts) > 1 else ''
+        method = parts[0]
+
+        with self.lock:
+            if method != 'GET':
+                self._respond(sub, '405 Method Not Allowed', 'text/plain', b'Method Not Allowed\n')
+            elif path == '/':
+                self._respond(sub, '200 OK', 'text/html; charset=utf-8', WEB_PAGE)
+            elif path == '/frame.jpg':
+                if self.image is None:
+                    self._respond(sub, '503 Service Unavailable', 'text/plain', b'No frame yet\n')
+                else:
+                    jpeg = self._get_jpeg()
+                    body = jpeg[jpeg.index(b'\r\n\r\n') + 4:-2]  # パートのヘッダを除く
+                    self._respond(sub, '200 OK', 'image/jpeg', body)
+            elif path == '/stream.mjpg':
+                # 応答ヘッダは out に直接置く（pending は send_image() が最新のフレームに置き換える）
+                header = (
+                    b'HTTP/1.1 200 OK\r\nCache-Control: no-cache\r\nConnection: close\r\n'
+                    b'Content-Type: multipart/x-mixed-replace; boundary=' + MJPEG_BOUNDARY
+                    + b'\r\n\r\n'
+                )
+                sub.out = memoryview(header + (self._get_jpeg() if self.image is not None else b''))
+                sub.kind = "mjpeg"
+            elif path == '/ws' and headers.get('upgrade', '').lower() == 'websocket' \
+                    and 'sec-websocket-key' in headers:
+                accept = base64.b64encode(
+                    hashlib.sha1(headers['sec-websocket-key'].encode() + WS_GUID).digest()
+                )
+                header = (
+                    b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                    b'Connection: Upgrade\r\nSec-WebSocket-Accept: ' + accept + b'\r\n\r\n'
+                )
+                if self.image is not None:
+                    header += self._get_keyframe()
+                    sub.synced = True
+                    if self.ws_prev is None:  # 次のフレームはこの画像からの差分にする
+                        self.ws_prev = np.asarray(self.image)
+                sub.out = memoryview(header)
+                sub.kind = "ws"
+            else:
+                self._respond(sub, '404 Not Found', 'text/plain', b'Not Found\n')
+        sub.request = None
+        if sub.kind in ("mjpeg", "ws"):
+            logger.info(f"Web viewer connected: {sub.addr} ({sub.kind})")
+
+    @staticmethod
+    def _respond(sub, status, content_type, body):
+        """1回だけの応答を送信待ちにする（送り終えたら切断）"""
+        sub.kind = "page"
+        sub.close_after = True
+        sub.pending = (
+            f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'
+        ).encode() + body
+
+    def _flush(self, sub):
+        super()._flush(sub)
+        if sub.close_after and sub.out is None and sub.pending is None \
+                and sub.sock.fileno() in self.subscribers:
+            self._remove(sub)
+
+    def _remove(self, sub):
+        with self.lock:
+            self.subscribers.pop(sub.sock.fileno(), None)
+        try:
+            self.selector.unregister(sub.sock)
+        except (KeyError, ValueError):
+            pass
+        sub.sock.close()
+        if sub.kind in ("mjpeg", "ws"):
+            logger.info(f"Web viewer disconnected: {sub.addr}")
 
-        except Exception as e:
-            logger.error(f"送信エラー: {str(e)}")
-        finally:
-            if sock is not None:
-                try:
-                    sock.close()
-                except Exception as e:
-                    logger.error(f"ソケットクローズエラー: {str(e)}")
 
 class ImageReceiver:
+    """NetView の受信側
+
+    受信データは header のサイズに合わせて確保した bytearray に recv_into で直接読み込み、
+    次のフレームでも同じバッファを使い回す。
+    """
+
     def __init__(self, host='0.0.0.0', port=49011):
         self.host = host
         self.port = port
+        self.header = bytearray(4)
+        self.buffer = bytearray()  # フレーム受信用（必要な大きさまで拡張して使い回す）
+        # 統計
+        self.frames_received = 0
+        self.bytes_received = 0
+
+    def _listen(self):
+        server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_sock.bind((self.host, self.port))
+        server_sock.listen(1)
+        print(f"Listening on {self.host}:{self.port} ...")
+        return server_sock
 
     def receive_image_data(self):
         """サーバとして接続を待ち、画像データ（バイト列）を受信して返す"""
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_sock:
-            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_sock.bind((self.host, self.port))
-            server_sock.listen(1)
-            print(f"Listening on {self.host}:{self.port} ...")
+        with self._listen() as server_sock:
             conn, addr = server_sock.accept()
             with conn:
                 print(f"Connected by {addr}")
-
-                # 先頭4バイトでデータサイズを受信
-                size_data = conn.recv(4)
-                if len(size_data) < 4:
+                data = next(self._read_frames(conn), None)
+                if data is None:
                     raise RuntimeError("データサイズの受信に失敗しました")
-                size = struct.unpack('!I', size_data)[0]
-                print(f"受信データサイズ: {size} bytes")
+                print(f"受信データサイズ: {len(data)} bytes")
+                print("画像データ受信完了")
+                return bytes(data)
 
-                # データ本体を受信
-                received = b''
-                while len(received) < size:
-                    chunk = conn.recv(min(4096, size - len(received)))
-                    if not chunk:
-                        raise RuntimeError("データ受信中に接続が切れました")
-                    received += chunk
+    def receive_frames(self):
+        """サーバとして接続を待ち、受信した画像データを順に返すジェネレータ
 
-                print("画像データ受信完了")
-                return received
+        1本の接続で連続して送られるフレームを受信し、接続が切れたら（フレームの途中でも）次の接続を待つ。
+        返す memoryview は受信バッファを指すため、次のフレームを受信するまでの間だけ有効。
+        """
+        with self._listen() as server_sock:
+            while True:
+                conn, addr = server_sock.accept()
+                with conn:
+                    print(f"Connected by {addr}")
+                    try:
+                        yield from self._read_frames(conn)
+                    except RuntimeError as e:
+                        print(e)
+                print(f"Disconnected {addr}")
+
+    def subscribe_frames(self):
+        """ImagePublisher（host:port）に接続し、配信されるフレームを順に返すジェネレータ"""
+        with socket.create_connection((self.host, self.port)) as conn:
+            print(f"Subscribed to {self.host}:{self.port}")
+            yield from self._read_frames(conn)
+
+    def serve(self, callback, report_interval=60.0):
+        """フレームを受信するたびに callback(data) を呼び続ける（受信側デーモン用）
+
+        report_interval 秒ごとに受信フレームレートを表示する。
+        """
+        report_time = time.monotonic()
+        report_frames = self.frames_received
+        for data in self.receive_frames():
+            callback(data)
+            now = time.monotonic()
+            if now - report_time >= report_interval:
+                fps = (self.frames_received - report_frames) / (now - report_time)
+                print(f"受信: {fps:.2f} frames/sec (累計 {self.frames_received} frames, "
+                      f"{self.bytes_received} bytes)")
+                report_time = now
+                report_frames = self.frames_received
+
+    def _read_frames(self, conn):
+        """1本の接続から連続するフレームを読み出す（フレームの途中で接続が切れたら RuntimeError）"""
+        header = memoryview(self.header)
+        while True:
+            if not self._recv_into(conn, header):
+                return
+            size = struct.unpack('!I', self.header)[0]
+            if len(self.buffer) < size:
+                self.buffer = bytearray(size)
+            view = memoryview(self.buffer)[:size]
+            if size and not self._recv_into(conn, view):
+                raise RuntimeError("データ受信中に接続が切れました")
+            self.frames_received += 1
+            self.bytes_received += size + 4
+            yield view
+
+    def receive_images(self, frames=None):
+        """フレームを PIL 画像にして順に返すジェネレータ
+
+        frames を省略した場合は receive_frames() で受信する。
+        """
+        decoder = FrameDecoder()
+        for data in frames if frames is not None else self.receive_frames():
+            try:
+                yield decoder.decode(data)
+            except ValueError as e:
+                print(f"フレームの復元に失敗しました: {e}")
+
+    @staticmethod
+    def _recv_into(conn, view):
+        """view が埋まるまで受信する。1バイトも受信せずに接続が切れた場合は False、途中で切れた場合は RuntimeError"""
+        received = 0
+        size = len(view)
+        while received < size:
+            n = conn.recv_into(view[received:])
+            if n == 0:
+                if received:
+                    raise RuntimeError("データ受信中に接続が切れました")
+                return False
+            received += n
+        return True
 
     def save_png(self, data: bytes, filename: str):
         """受信したPNGバイト列をファイルに保存"""
@@ -0,0 +1,185 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+
+HOUR = 60 * 60 * 1000  # ミリ秒
+MAX_SGV = 400  # ヒストグラムの上限（CGM が表示できる最大値）
+# 範囲の区切り: <54, 54-69, 70-180（目標範囲）, 181-250, >250
+RANGE_LIMITS = (54, 70, 181, 251)
+TARGET_RANGE = 2  # 目標範囲の区分
+AGP_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def range_index(sgv):
+    """SGV値が RANGE_LIMITS のどの区分に入るか"""
+    for i, limit in enumerate(RANGE_LIMITS):
+        if sgv < limit:
+            return i
+    return len(RANGE_LIMITS)
+
+
+def gmi(mean):
+    """平均値（mg/dL）から GMI（%）を求める"""
+    return 3.31 + 0.02392 * mean
+
+
+def local_hour(timestamp):
+    """日時（ミリ秒）の (日付の序数, 時) をローカル時刻で返す"""
+    dt = datetime.fromtimestamp(timestamp / 1000)
+    return dt.toordinal(), dt.hour
+
+
+class DayBucket:
+    """1日分の集計（時間帯ごとのヒストグラムと、範囲の区分ごとの件数）"""
+
+    def __init__(self, bins):
+        self.hist = np.zeros((24, bins), np.uint16)
+        self.ranges = [0] * (len(RANGE_LIMITS) + 1)
+        self.count = 0
+        self.total = 0  # SGV値の合計
+
+
+class Rollup:
+    """SGVの日ごと・時間帯ごとの集計をレコードの追加ごとに更新するクラス
+
+    日ごとに、時間帯（0〜23時）別の bin_width mg/dL 幅のヒストグラムと
+    範囲の区分ごとの件数・合計を持つ。範囲内の割合・平均・GMI と
+    AGP の百分位（ヒストグラムを補間した近似値、誤差は bin_width 以内）を
+    履歴の長さによらず一定の計算量で求める。days 日より前の日は捨てる。
+    複数のスレッドから使える。
+    """
+
+    def __init__(self, days=14, bin_width=5):
+        self.days = days
+        self.bin_width = bin_width
+        self.bins = MAX_SGV // bin_width + 1
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.buckets = {}  # 日付の序数 -> DayBucket
+            self.first_date = None  # 集計済みの最古・最新のレコードの日時
+            self.last_date = None
+            self.version = 0  # 集計が変わるたびに増やす（描画の省略に使う）
+            self.agp_cache = None  # (version, days, 百分位)
+
+    def _bucket(self, day):
+        bucket = self.buckets.get(day)
+        if bucket is None:
+            if self.buckets and day <= max(self.buckets) - self.days:
+                return None  # 保持する期間より前
+            bucket = self.buckets[day] = DayBucket(self.bins)
+            for old in [d for d in self.buckets if d <= day - self.days]:
+                del self.buckets[old]
+        return bucket
+
+    def _count(self, day, hour, bin_index, range_index, count, total):
+        bucket = self._bucket(day)
+        if bucket is None:
+            return
+        bucket.hist[hour, min(max(bin_index, 0), self.bins - 1)] += count
+        bucket.ranges[range_index] += count
+        bucket.count += count
+        bucket.total += total
+
+    def add(self, timestamp, sgv):
+        """最新より新しいレコードを集計に加える（O(1)）"""
+        timestamp = int(timestamp)
+        sgv = int(sgv)
+        with self.lock:
+            if self.last_date is not None and timestamp <= self.last_date:
+                return False
+            day, hour = local_hour(timestamp)
+            self._count(day, hour, sgv // self.bin_width, range_index(sgv), 1, sgv)
+            self.last_date = timestamp
+            if self.first_date is None:
+                self.first_date = timestamp
+            self.version += 1
+        return True
+
+    def merge_hours(self, docs):
+        """
+        サーバーで集計した1時間ごとの結果を加える（集計済みより古い期間の分）
+        :param docs: [{'_id': 時の開始（ミリ秒）, 'bins': [{'b': ビン, 'r': 区分, 'n': 件数}, ...],
+                      's': 合計, 'f': 最古の日時, 't': 最新の日時}, ...]
+        :return: 加えた件数
+        """
+        added = 0
+        with self.lock:
+            for doc in docs:
+                # UTC の1時間をその中央のローカル時刻の時間帯に入れる
+                day, hour = local_hour(int(doc["_id"]) + HOUR // 2)
+                count = sum(int(b["n"]) for b in doc["bins"])
+                total = int(doc["s"])
+                for i, b in enumerate(doc["bins"]):
+                    # 合計は1件目にまとめて加える
+                    self._count(day, hour, int(b["b"]), int(b["r"]), int(b["n"]),
+                                total if i == 0 else 0)
+                added += count
+                first, last = int(doc["f"]), int(doc["t"])
+                self.first_date = first if self.first_date is None else min(self.first_date, first)
+                self.last_date = last if self.last_date is None else max(self.last_date, last)
+            if added:
+                self.version += 1
+        return added
+
+    def _recent(self, days):
+        """最新の日から days 日分の DayBucket"""
+        if not self.buckets:
+            return []
+        newest = max(self.buckets)
+        return [b for d, b in self.buckets.items() if d > newest - days]
+
+    def summary(self, days=1):
+        """
+        最新の日を含む直近 days 日の集計
+        :return: {count, mean, gmi, tir, ranges}（割合は 0〜1）。レコードがなければ None
+        """
+        with self.lock:
+            buckets = self._recent(days)
+            count = sum(b.count for b in buckets)
+            if not count:
+                return None
+            total = sum(b.total for b in buckets)
+            ranges = [sum(b.ranges[i] for b in buckets) / count for i in range(len(RANGE_LIMITS) + 1)]
+        mean = total / count
+        return {
+            "count": count,
+            "mean": mean,
+            "gmi": gmi(mean),
+            "tir": ranges[TARGET_RANGE],
+            "ranges": ranges,
+        }
+
+    def agp(self, days=None):
+        """
+        AGP（時間帯ごとの百分位）
+        :return: (24, len(AGP_PERCENTILES)) の配列。データのない時間帯は nan
+        """
+        days = self.days if days is None else days
+        with self.lock:
+            if self.agp_cache is not None and self.agp_cache[:2] == (self.version, days):
+                return self.agp_cache[2]
+            buckets = self._recent(days)
+            hist = np.zeros((24, self.bins), np.int64)
+            for bucket in buckets:
+                hist += bucket.hist
+            version = self.version
+
+        bands = np.full((24, len(AGP_PERCENTILES)), np.nan)
+        cumulative = np.cumsum(hist, axis=1)
+        for hour in range(24):
+            n = cumulative[hour, -1]
+            if not n:
+                continue
+            targets = np.array(AGP_PERCENTILES) / 100 * n
+            idx = np.searchsorted(cumulative[hour], targets, "left")
+            before = np.where(idx > 0, cumulative[hour, idx - 1], 0)
+            # ビンの中では値が一様に分布しているとみなして補間する
+            fraction = (targets - before) / np.maximum(hist[hour, idx], 1)
+            bands[hour] = (idx + fraction) * self.bin_width
+        with self.lock:
+            self.agp_cache = (version, days, bands)
+        return bands
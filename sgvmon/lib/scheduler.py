@@ -0,0 +1,73 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Scheduler:
+    """タイマー（ヒープ）と通知で処理のタイミングを決めるクラス
+
+    schedule() で登録した時刻（time.time() と同じ壁時計の秒）になるか、
+    別スレッドから notify() されるまで wait() で眠る。
+    固定間隔のループと違い、やることがない間は起きない。
+    """
+
+    NOTIFY = "notify"  # notify() で起きた場合の名前
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.timers = []  # (時刻, 連番, 名前) のヒープ
+        self.seq = itertools.count()
+        self.event = threading.Event()
+        self.wakeups = 0
+
+    def schedule(self, when, name):
+        """when（秒）に name のタイマーを登録する"""
+        heapq.heappush(self.timers, (when, next(self.seq), name))
+
+    def reschedule(self, when, name):
+        """name のタイマーを when の1つだけにする"""
+        self.cancel(name)
+        self.schedule(when, name)
+
+    def cancel(self, name):
+        """name のタイマーをすべて取り消す"""
+        timers = [timer for timer in self.timers if timer[2] != name]
+        if len(timers) != len(self.timers):
+            heapq.heapify(timers)
+            self.timers = timers
+
+    def next_time(self, name):
+        """name のタイマーの時刻（なければ None）"""
+        times = [timer[0] for timer in self.timers if timer[2] == name]
+        return min(times) if times else None
+
+    def notify(self):
+        """wait() で眠っている処理を起こす（別スレッドから呼べる）"""
+        self.event.set()
+
+    def wait(self, timeout=None):
+        """
+        次のタイマーの時刻か notify() まで待つ
+        :param timeout: 最大待ち時間（秒）。None ならタイマーか通知があるまで待つ
+        :return: 起きた理由（タイマー名、通知なら NOTIFY）のリスト。タイムアウトなら空
+        """
+        limit = None if timeout is None else self.clock() + timeout
+        while True:
+            now = self.clock()
+            reasons = []
+            while self.timers and self.timers[0][0] <= now:
+                reasons.append(heapq.heappop(self.timers)[2])
+            if self.event.is_set():
+                self.event.clear()
+                reasons.append(self.NOTIFY)
+            if reasons:
+                self.wakeups += 1
+                return reasons
+
+            deadline = self.timers[0][0] if self.timers else limit
+            if limit is not None:
+                deadline = min(deadline, limit)
+                if now >= limit:
+                    return []
+            self.event.wait(None if deadline is None else deadline - now)
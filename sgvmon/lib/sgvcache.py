@@ -0,0 +1,112 @@
+import logging
+import mmap
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SGVC0001'  # ファイル先頭の識別子（形式を変えたら番号を上げる）
+RECORD = np.dtype([('date', '<i8'), ('sgv', '<i2')])  # 1レコード10バイト
+
+
+class SGVCache:
+    """SGVレコード (date, sgv) を追記していくローカルファイル
+
+    固定長のレコードを古い順にファイル末尾へ追記し、読み込みは mmap で
+    必要な末尾の部分だけを NumPy 配列として参照する。
+    書き込み中に止まった場合の半端なレコードは open() で切り捨てる。
+    レコード数が max_records の compact_factor 倍を超えたら、open() で
+    直近 max_records 件だけのファイルに作り直す。
+    """
+
+    def __init__(self, path, max_records, compact_factor=4):
+        self.path = path
+        self.max_records = max_records
+        self.compact_factor = compact_factor
+        self.file = None
+        self.count = 0  # ファイル内のレコード数
+        self.last_date = 0  # 最新レコードの日時
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if not self._valid_header():
+            if os.path.exists(self.path):
+                logger.warning(f"キャッシュの形式が違うため作り直します: {self.path}")
+            self._write_file(np.empty(0, RECORD))
+
+        size = os.path.getsize(self.path) - len(MAGIC)
+        self.count = size // RECORD.itemsize
+        if size % RECORD.itemsize:
+            logger.warning("キャッシュ末尾の半端なレコードを切り捨てます")
+            os.truncate(self.path, len(MAGIC) + self.count * RECORD.itemsize)
+
+        if self.count > self.max_records * self.compact_factor:
+            records = self._read(self.max_records)
+            self._write_file(records)
+            self.count = len(records)
+            logger.info(f"キャッシュを {self.count} 件に縮小しました")
+
+        records = self._read(1)
+        self.last_date = int(records['date'][0]) if len(records) else 0
+        self.file = open(self.path, 'ab')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _valid_header(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read(len(MAGIC)) == MAGIC
+        except OSError:
+            return False
+
+    def _write_file(self, records):
+        """records だけのファイルを作り、置き換える"""
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _read(self, limit):
+        """末尾 limit 件のレコードのコピーを返す"""
+        n = min(limit, self.count)
+        if not n:
+            return np.empty(0, RECORD)
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = len(MAGIC) + (self.count - n) * RECORD.itemsize
+            records = np.frombuffer(mm, RECORD, count=n, offset=offset).copy()
+        return records
+
+    def load(self, limit):
+        """
+        直近 limit 件のレコードを読み込む
+        :return: (timestamps, values) 古い順の配列
+        """
+        records = self._read(limit)
+        return records['date'].astype(np.int64), records['sgv'].astype(np.int16)
+
+    def append(self, timestamps, values):
+        """
+        レコードを追記する（保存済みの最新より古いものは追記しない）
+        :param timestamps: 日時のリスト（古い順）
+        :param values: SGV値のリスト
+        :return: 追記した件数
+        """
+        records = np.empty(len(timestamps), RECORD)
+        records['date'] = timestamps
+        records['sgv'] = values
+        records = records[records['date'] > self.last_date]
+        if not len(records):
+            return 0
+        self.file.write(records.tobytes())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.count += len(records)
+        self.last_date = int(records['date'][-1])
+        return len(records)
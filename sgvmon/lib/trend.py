@@ -0,0 +1,111 @@
+from collections import deque, namedtuple
+
+RATE_WINDOW = 15 * 60 * 1000  # 変化率を求める期間（ミリ秒）
+FORECAST_HORIZON = 30 * 60 * 1000  # 予測する先の時間（ミリ秒）
+MIN_SGV = 39  # CGM が表示できる範囲（予測値はこの範囲に収める）
+MAX_SGV = 400
+
+# (変化率の下限 mg/dL/min, 矢印) Nightscout の direction と同じ区分
+ARROWS = (
+    (3, "DoubleUp"),
+    (2, "SingleUp"),
+    (1, "FortyFiveUp"),
+    (-1, "Flat"),
+    (-2, "FortyFiveDown"),
+    (-3, "SingleDown"),
+)
+
+# 最新のレコードの時点のトレンド
+#   rate: 変化率（mg/dL/min）, arrow: 矢印の名前（ARROWS）
+#   forecast: forecast_time（ミリ秒）の予測値
+Trend = namedtuple("Trend", ["timestamp", "sgv", "rate", "arrow", "forecast_time", "forecast"])
+
+
+def trend_arrow(rate):
+    """変化率（mg/dL/min）から矢印の名前を返す"""
+    for lower, arrow in ARROWS:
+        # 上向きは下限を含み、下向きは含まない（-1 < rate < 1 が Flat）
+        if rate >= lower if lower > 0 else rate > lower:
+            return arrow
+    return "DoubleDown"
+
+
+class TrendEngine:
+    """SGVのトレンド（変化率・矢印・予測値）をレコードの追加ごとに更新するクラス
+
+    直近 window ミリ秒のレコードの件数と時刻・値の和（Σt, Σv, Σt², Σtv）を
+    追加と削除のたびに足し引きし、最小二乗法の直線から変化率と予測値を求める。
+    和は窓の最古のレコードを原点にした整数で持つため誤差がたまらず、
+    1件あたりの処理は履歴の長さによらず O(1)。
+    """
+
+    def __init__(self, window=RATE_WINDOW, horizon=FORECAST_HORIZON, min_points=3):
+        self.window = window
+        self.horizon = horizon
+        self.min_points = min_points  # トレンドを出すのに必要な件数
+        self.reset()
+
+    def reset(self):
+        self.points = deque()  # 窓の中の (timestamp, sgv)
+        self.origin = 0  # 和の時刻の原点（窓の最古のレコード）
+        self.n = 0
+        self.sum_t = 0
+        self.sum_v = 0
+        self.sum_tt = 0
+        self.sum_tv = 0
+        self.trend = None
+
+    def add(self, timestamp, sgv):
+        """最新より新しいレコードを追加してトレンドを更新する"""
+        timestamp = int(timestamp)
+        sgv = int(sgv)
+        if self.points and timestamp <= self.points[-1][0]:
+            return False
+        if not self.points:
+            self.origin = timestamp
+
+        self.points.append((timestamp, sgv))
+        self._accumulate(timestamp - self.origin, sgv, 1)
+        # 窓から外れたレコードを除き、原点を窓の最古のレコードに移す
+        while timestamp - self.points[0][0] > self.window:
+            old_time, old_sgv = self.points.popleft()
+            self._accumulate(old_time - self.origin, old_sgv, -1)
+        self._shift(self.points[0][0] - self.origin)
+
+        self.trend = self._compute(timestamp, sgv)
+        return True
+
+    def _accumulate(self, t, v, sign):
+        self.n += sign
+        self.sum_t += sign * t
+        self.sum_v += sign * v
+        self.sum_tt += sign * t * t
+        self.sum_tv += sign * t * v
+
+    def _shift(self, d):
+        """和の時刻の原点を d ミリ秒後ろにずらす"""
+        if not d:
+            return
+        self.sum_tt += -2 * d * self.sum_t + self.n * d * d
+        self.sum_tv -= d * self.sum_v
+        self.sum_t -= self.n * d
+        self.origin += d
+
+    def _compute(self, timestamp, sgv):
+        if self.n < self.min_points:
+            return None
+        sxx = self.n * self.sum_tt - self.sum_t * self.sum_t
+        if not sxx:
+            return None
+        slope = (self.n * self.sum_tv - self.sum_t * self.sum_v) / sxx  # mg/dL/ms
+        intercept = (self.sum_v - slope * self.sum_t) / self.n
+        fitted = intercept + slope * (timestamp - self.origin)
+        rate = slope * 60_000
+        forecast = min(max(fitted + slope * self.horizon, MIN_SGV), MAX_SGV)
+        return Trend(timestamp, sgv, rate, trend_arrow(rate),
+                     timestamp + self.horizon, int(round(forecast)))
+
+    def current(self):
+        """最新のレコードの時点のトレンド（件数が足りなければ None）"""
+        return self.trend
+
@@ -2,21 +2,33 @@
 #
 # 2025/06/11 First Version For 3.5 LCD
 #
+import math
 import os
 import sys
 from datetime import datetime  # , timezone, timedelta
 import time
 import logging
+import threading
+from http.client import HTTPException
 
-from pymongo import MongoClient
+STARTUP_TIME = time.perf_counter()  # 起動時間の計測の基準
+
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from dotenv import load_dotenv
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, os.path.join(BASE_DIR, "lib"))
 from fb import Framebuffer
-from nvsend import ImageSender
+from nvsend import ImageSender, ImagePublisher, WebStreamServer, BackgroundSender
+from scheduler import Scheduler
+from metrics import Metrics, MetricsServer, PhaseTimer
+from sgvcache import SGVCache
+from nightscout import NightscoutClient, NightscoutError
+from trend import TrendEngine
+from rollup import Rollup, HOUR, RANGE_LIMITS
 from drawgraph import DrawGraph
+from textcache import TextCache
 
 # .env 読み込み
 load_dotenv()
@@ -34,50 +46,316 @@ logger.setLevel(numeric_level)
 # 定数
 DISP_WIDTH = int(os.getenv("DISP_WIDTH"))
 DISP_HEIGHT = int(os.getenv("DISP_HEIGHT"))
-TARGET_FPS = 5  # 目標FPS
-FRAME_TIME = 1.0 / TARGET_FPS  # 1フレームの目標時間（秒）
 # DRAW_INT = int(os.getenv('REFRESH_INTERVAL')) # n秒に1回画面書き換え
+FB_DEVICE = os.getenv("FB_DEVICE", "/dev/fb0")  # フレームバッファ（通常のファイルも可）
+CACHE_DIR = os.path.expanduser(os.getenv("CACHE_DIR", "~/.cache/sgvmon"))  # 起動画面などのキャッシュ
+SGV_CACHE = os.getenv("SGV_CACHE", "1") == "1"  # 取得したレコードを CACHE_DIR に保存
 NETVIEW_HOST = os.getenv("NETVIEW_HOST")
-MAX_RECORDS = 50  # 保持する最大レコード数
+NETVIEW_PORT = int(os.getenv("NETVIEW_PORT", "49011"))
+NETVIEW_PERSISTENT = os.getenv("NETVIEW_PERSISTENT", "0") == "1"  # 接続を維持して送信
+NETVIEW_ENCODING = os.getenv("NETVIEW_ENCODING", "png")  # png または tile（差分送信）
+NETVIEW_PUBLISH_PORT = os.getenv("NETVIEW_PUBLISH_PORT")  # 複数ビューアへの配信ポート
+WEBVIEW_PORT = os.getenv("WEBVIEW_PORT")  # ブラウザで画面を見るための HTTP ポート（MJPEG / WebSocket）
+WEBVIEW_HOST = os.getenv("WEBVIEW_HOST", "0.0.0.0")
+WEBVIEW_JPEG_QUALITY = int(os.getenv("WEBVIEW_JPEG_QUALITY", "80"))
+METRICS_PORT = os.getenv("METRICS_PORT")  # 計測値（Prometheus形式）の公開ポート
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_LOG_INTERVAL = int(os.getenv("METRICS_LOG_INTERVAL", "300"))  # 計測値のログ間隔（秒）
+CGM_INTERVAL = 5 * 60  # CGMの測定間隔（秒）
+MAX_RECORDS = 14 * 24 * 60 * 60 // CGM_INTERVAL  # 保持する最大レコード数（14日分）
+GRAPH_RECORDS = 50  # グラフに表示するレコード数（起動時の読み込み件数）
+GRAPH_SPAN = GRAPH_RECORDS * CGM_INTERVAL * 1000  # グラフの表示期間（ミリ秒）
+GRAPH_TOP = 150  # グラフ表示位置（Y座標）
+GRAPH_HEIGHT = 140  # グラフの高さ
+# トレンドの矢印の向き（度、右が0で反時計回り）
+ARROW_ANGLES = {
+    "DoubleUp": 90,
+    "SingleUp": 90,
+    "FortyFiveUp": 45,
+    "Flat": 0,
+    "FortyFiveDown": -45,
+    "SingleDown": -90,
+    "DoubleDown": -90,
+}
+STALE_SECONDS = 10 * 60  # データが古いと判断するまでの秒数
+UPLOAD_DELAY = 15  # 測定からMongoDBに登録されるまでの余裕（秒）
+MIN_POLL_INTERVAL = 5  # ポーリング間隔の最小値（秒）
+MAX_POLL_INTERVAL = 60  # ポーリング間隔の最大値（秒）
+MIN_RETRY_INTERVAL = 5  # 取得のエラー後に再試行するまでの最小時間（秒、失敗が続くと倍にする）
+MAX_RETRY_INTERVAL = 300  # 再試行までの最大時間（秒）
+SGV_SOURCE = os.getenv("SGV_SOURCE", "mongo")  # SGVの取得元（mongo または nightscout）
+NIGHTSCOUT_URL = os.getenv("NIGHTSCOUT_URL")  # 例: https://example.herokuapp.com
+NIGHTSCOUT_TOKEN = os.getenv("NIGHTSCOUT_TOKEN")  # アクセストークン（readable）
+NIGHTSCOUT_API_SECRET = os.getenv("NIGHTSCOUT_API_SECRET")  # トークンの代わりに API_SECRET
+NIGHTSCOUT_TIMEOUT = float(os.getenv("NIGHTSCOUT_TIMEOUT", "10"))  # 秒
+# MongoDB の接続設定（応答しないサーバーで長時間止まらないよう短めにする）
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "4"))
+MONGO_CONNECT_TIMEOUT = float(os.getenv("MONGO_CONNECT_TIMEOUT", "5"))  # 秒
+MONGO_SOCKET_TIMEOUT = float(os.getenv("MONGO_SOCKET_TIMEOUT", "10"))  # 秒
+MONGO_SERVER_SELECTION_TIMEOUT = float(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT", "5"))  # 秒
+ROLLUP_DAYS = int(os.getenv("ROLLUP_DAYS", "14"))  # 集計（範囲内の割合・AGP）の期間（日）
+ROLLUP_BOOTSTRAP = os.getenv("ROLLUP_BOOTSTRAP", "1") == "1"  # 手元にない期間の集計をサーバーで行う
+AGP_VIEW_SECONDS = int(os.getenv("AGP_VIEW_SECONDS", "0"))  # グラフと AGP を切り替える秒数（0 なら AGP を表示しない）
+MONGO_STARTUP_WAIT = float(os.getenv("MONGO_STARTUP_WAIT", "10"))  # 起動時に初期データを待つ最大時間（秒）
 
 logger.info("Start SGV Monitor")
 
+# 処理段階ごとの所要時間
+METRICS = Metrics()
+
 # フォントの読み込み
 logger.info("Reading Fonts")
 FONT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../fonts"))
-FONT_SGV = ImageFont.truetype(os.path.join(FONT_DIR, os.getenv("FONT_PATH_SGV")), 200)
-FONT_SGV_S = ImageFont.truetype(os.path.join(FONT_DIR, os.getenv("FONT_PATH_SGV")), 72)
-FONT_SYS = ImageFont.truetype(os.path.join(FONT_DIR, os.getenv("FONT_PATH_SYS")), 24)
+FONT_SPECS = {  # 名前 -> (フォントファイル, サイズ)
+    "sgv": (os.getenv("FONT_PATH_SGV"), 200),
+    "sgv_s": (os.getenv("FONT_PATH_SGV"), 72),
+    "sys": (os.getenv("FONT_PATH_SYS"), 24),
+}
+_fonts = {}
+
+
+def load_font(name):
+    """フォントを返す（初めて使うときに読み込む）"""
+    font = _fonts.get(name)
+    if font is None:
+        path, size = FONT_SPECS[name]
+        font = _fonts[name] = ImageFont.truetype(os.path.join(FONT_DIR, path), size)
+    return font
+
+
+def splash_path(framebuffer):
+    """起動画面キャッシュのファイル名（画面の形式ごと）"""
+    fb = framebuffer
+    return os.path.join(
+        CACHE_DIR, f"splash-{fb.width}x{fb.height}-{fb.layout}-{fb.line_length}.raw"
+    )
+
+
+def show_splash(framebuffer):
+    """キャッシュした起動画面をフレームバッファへそのまま書き込む。なければ False"""
+    try:
+        with open(splash_path(framebuffer), "rb") as f:
+            return framebuffer.restore(f.read())
+    except OSError:
+        return False
+
+
+def save_splash(framebuffer):
+    """フレームバッファの内容を起動画面として保存"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(splash_path(framebuffer), "wb") as f:
+            f.write(framebuffer.snapshot())
+    except OSError as e:
+        logger.warning(f"splash cache is not saved: {e}")
 
 
-class GetSGV:
+class SGVSource:
+    """SGVの取得元の基底クラス（問い合わせの統計と再試行の間隔）
+
+    派生クラスは fetch_since() / init_sgv_docs() / close() と、取得の失敗を表す
+    例外クラス errors を用意する。watch() で追加を待てない取得元はポーリングになる。
+    """
+
+    name = "source"  # 計測値の名前に使う
+    errors = ()
+
     def __init__(self):
-        # MongoDB 接続
-        logger.info("Connecting MongoDB...")
-        logger.info(f'host: {os.getenv("MONGO_URI")}:{os.getenv("MONGO_PORT")}')
-        self.mongo_client = MongoClient(
-            os.getenv("MONGO_URI"),
-            int(os.getenv("MONGO_PORT")),
-            username=os.getenv("MONGO_USER"),
-            password=os.getenv("MONGO_PASS"),
+        # 統計
+        self.fetch_count = 0
+        self.failure_count = 0
+        self.consecutive_failures = 0  # 連続した失敗の回数（再試行の間隔に使う）
+        self.last_error = None
+
+    def succeeded(self):
+        """問い合わせの成功を記録"""
+        self.fetch_count += 1
+        self.consecutive_failures = 0
+
+    def failed(self, error):
+        """問い合わせの失敗を記録"""
+        self.fetch_count += 1
+        self.failure_count += 1
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+        METRICS.count(f"{self.name}_error")
+
+    def retry_interval(self):
+        """失敗が続いている場合の再試行までの秒数（指数バックオフ）。失敗していなければ 0"""
+        if not self.consecutive_failures:
+            return 0
+        return min(
+            MIN_RETRY_INTERVAL * 2 ** (self.consecutive_failures - 1), MAX_RETRY_INTERVAL
         )
-        logger.info("OK")
 
-    # 戻値: [データ日時(UnixTime), SGV値]
-    def last_sgv_doc(self):
+    def stats(self):
+        """問い合わせの統計を返す"""
+        return {
+            "fetches": self.fetch_count,
+            "failures": self.failure_count,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+        }
+
+    def watch(self, on_insert, stop_event):
+        """追加を待ち受けられない取得元は False（ポーリングする）"""
+        return False
+
+    def rollup_hours(self, since, until, bin_width):
+        """サーバー側で集計できない取得元は None（Rollup.merge_hours を参照）"""
+        return None
+
+    @staticmethod
+    def poll_interval(last_date, now):
+        """次のポーリングまでの秒数（次の測定予定時刻から求める）"""
+        expected = last_date / 1000 + CGM_INTERVAL + UPLOAD_DELAY
+        wait = expected - now
+        if wait > 0:  # 次の測定予定まで待つ
+            return min(max(wait, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+        # 予定時刻を過ぎている場合は短い間隔で確認し、遅れが長くなるほど間隔を延ばす
+        missed = int(-wait // CGM_INTERVAL)
+        return min(MIN_POLL_INTERVAL * (missed + 1), MAX_POLL_INTERVAL)
+
+
+class GetSGV(SGVSource):
+    """MongoDB（Nightscout の test.entries）からSGVを取得するクラス"""
+
+    name = "mongo"
+
+    def __init__(self, mongo_client=None):
+        super().__init__()
+        if mongo_client is None:
+            # MongoDB 接続（pymongo の読み込みは時間がかかるため使う時に行う）
+            from pymongo import MongoClient
+
+            logger.info("Connecting MongoDB...")
+            logger.info(f'host: {os.getenv("MONGO_URI")}:{os.getenv("MONGO_PORT")}')
+            mongo_client = MongoClient(
+                os.getenv("MONGO_URI"),
+                int(os.getenv("MONGO_PORT")),
+                username=os.getenv("MONGO_USER"),
+                password=os.getenv("MONGO_PASS"),
+                appname="sgvmon",
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                connectTimeoutMS=int(MONGO_CONNECT_TIMEOUT * 1000),
+                socketTimeoutMS=int(MONGO_SOCKET_TIMEOUT * 1000),
+                serverSelectionTimeoutMS=int(MONGO_SERVER_SELECTION_TIMEOUT * 1000),
+            )
+            logger.info("OK")
+        self.mongo_client = mongo_client
+
+    @property
+    def errors(self):
+        # pymongo は接続する時に読み込む
+        from pymongo.errors import PyMongoError
+
+        return PyMongoError
+
+    # 戻値: [[データ日時(UnixTime), SGV値], ...] 新しい順
+    def fetch_since(self, last_date, limit=MAX_RECORDS):
+        """last_date より新しいレコードだけを取得（欠測後にまとめて届いた分も含む）"""
+        from pymongo.errors import PyMongoError
+
         try:
             col = self.mongo_client.test.entries
-            doc = col.find_one(sort=[("date", -1)])  # 最新1件のみ取得
-        except:
-            return None
-        return [doc["date"], doc["sgv"]] if doc else None
+            with METRICS.stage("mongo_fetch"):
+                find = (
+                    col.find(
+                        {"date": {"$gt": last_date}, "sgv": {"$exists": True}},
+                        {"_id": 0, "date": 1, "sgv": 1},
+                    )
+                    .sort("date", -1)
+                    .limit(limit)
+                )
+                records = [[doc["date"], doc["sgv"]] for doc in find]
+        except PyMongoError as e:
+            logger.warning(f"fetch_since failed: {e}")
+            self.failed(e)
+            return []
+        self.succeeded()
+        return records
+
+    def watch(self, on_insert, stop_event):
+        """change stream でエントリの追加を待ち、追加される度に on_insert() を呼ぶ
+
+        stop_event がセットされるまで戻らない（True を返す）。
+        サーバーが change stream に対応していない場合（レプリカセットでない等）は False を返す。
+        """
+        from pymongo.errors import OperationFailure
+
+        col = self.mongo_client.test.entries
+        try:
+            with col.watch(
+                [{"$match": {"operationType": "insert"}}], max_await_time_ms=1000
+            ) as stream:
+                logger.info("Watching entries (change stream)")
+                on_insert()  # 監視開始までに追加された分
+                while not stop_event.is_set():
+                    if stream.try_next() is not None:
+                        on_insert()
+        except OperationFailure as e:
+            logger.info(f"change stream is not available: {e}")
+            return False
+        return True
+
+    def rollup_hours(self, since, until, bin_width):
+        """
+        since 以上 until 未満のレコードを、1時間・SGVのビン・範囲の区分ごとの件数に
+        サーバー側で集計して返す（レコードそのものは転送しない）
+        :return: Rollup.merge_hours() に渡すリスト
+        """
+        # 範囲の区分: RANGE_LIMITS の何番目の区切りより小さいか
+        range_index = {
+            "$switch": {
+                "branches": [
+                    {"case": {"$lt": ["$sgv", limit]}, "then": i}
+                    for i, limit in enumerate(RANGE_LIMITS)
+                ],
+                "default": len(RANGE_LIMITS),
+            }
+        }
+        pipeline = [
+            {"$match": {"date": {"$gte": since, "$lt": until}, "sgv": {"$exists": True}}},
+            {
+                "$group": {
+                    "_id": {
+                        "h": {"$subtract": ["$date", {"$mod": ["$date", HOUR]}]},
+                        "b": {"$floor": {"$divide": ["$sgv", bin_width]}},
+                        "r": range_index,
+                    },
+                    "n": {"$sum": 1},
+                    "s": {"$sum": "$sgv"},
+                    "f": {"$min": "$date"},
+                    "t": {"$max": "$date"},
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$_id.h",
+                    "bins": {"$push": {"b": "$_id.b", "r": "$_id.r", "n": "$n"}},
+                    "s": {"$sum": "$s"},
+                    "f": {"$min": "$f"},
+                    "t": {"$max": "$t"},
+                }
+            },
+        ]
+        with METRICS.stage("mongo_rollup"):
+            docs = list(self.mongo_client.test.entries.aggregate(pipeline))
+        self.succeeded()
+        return docs
 
     # 戻値: [[データ日時(UnixTime), SGV値], ...]
     def init_sgv_docs(self, limit=50):
         logger.info("init_sgv_docs called")
         col = self.mongo_client.test.entries
-        find = col.find().sort("date", -1).limit(limit)
+        find = (
+            col.find({"sgv": {"$exists": True}}, {"_id": 0, "date": 1, "sgv": 1})
+            .sort("date", -1)
+            .limit(limit)
+        )
         ret = [[doc["date"], doc["sgv"]] for doc in find]
+        self.succeeded()
         logger.info("init_sgv_docs end")
         return ret
 
@@ -85,62 +363,321 @@ class GetSGV:
         self.mongo_client.close()
 
 
+class NightscoutSGV(SGVSource):
+    """Nightscout の REST API（/api/v1/entries）からSGVを取得するクラス
+
+    MongoDB に直接接続できない環境向け。追加の通知はないためポーリングになる。
+    """
+
+    name = "nightscout"
+    errors = (OSError, HTTPException, ValueError, NightscoutError)
+
+    def __init__(self, client=None):
+        super().__init__()
+        if client is None:
+            logger.info(f"Nightscout: {NIGHTSCOUT_URL}")
+            client = NightscoutClient(
+                NIGHTSCOUT_URL,
+                token=NIGHTSCOUT_TOKEN,
+                api_secret=NIGHTSCOUT_API_SECRET,
+                timeout=NIGHTSCOUT_TIMEOUT,
+            )
+        self.client = client
+
+    @staticmethod
+    def _records(entries):
+        """エントリを [[日時, SGV値], ...] 新しい順にする"""
+        records = [[e["date"], e["sgv"]] for e in entries if "date" in e and "sgv" in e]
+        records.sort(reverse=True)
+        return records
+
+    # 戻値: [[データ日時(UnixTime), SGV値], ...] 新しい順
+    def fetch_since(self, last_date, limit=MAX_RECORDS):
+        """last_date より新しいレコードだけを取得"""
+        try:
+            with METRICS.stage("nightscout_fetch"):
+                records = self._records(self.client.entries_since(last_date, limit))
+        except self.errors as e:
+            logger.warning(f"fetch_since failed: {e}")
+            self.failed(e)
+            return []
+        self.succeeded()
+        return records
+
+    # 戻値: [[データ日時(UnixTime), SGV値], ...]
+    def init_sgv_docs(self, limit=50):
+        records = self._records(self.client.entries_since(None, limit))
+        self.succeeded()
+        return records
+
+    def stats(self):
+        return dict(super().stats(), **self.client.stats())
+
+    def close(self):
+        self.client.close()
+
+
+def create_source():
+    """SGV_SOURCE に応じたSGVの取得元を作る"""
+    if SGV_SOURCE == "nightscout":
+        return NightscoutSGV()
+    return GetSGV()
+
+
+class SGVWatcher:
+    """新しいSGVを別スレッドで待ち受けるクラス
+
+    取得元（GetSGV 等）の watch() で追加を待ち、使えない場合は
+    poll_interval() の間隔でポーリングする。
+    新しいレコードが届くと wait() で待っている側を起こし、on_data() を呼ぶ。
+    """
+
+    def __init__(self, get_sgv, last_date=0, on_data=None):
+        self.get_sgv = get_sgv
+        self.last_date = last_date
+        self.on_data = on_data
+        self.mode = None  # "push" または "poll"
+        self.lock = threading.Lock()
+        self.records = []  # 受け取り待ちのレコード（新しい順）
+        self.data_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="sgvwatch", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def wait(self, timeout):
+        """新しいレコードが届くか timeout 秒経過するまで待つ。届いていれば True"""
+        return self.data_event.wait(timeout)
+
+    def take_records(self):
+        """届いたレコードを取り出す"""
+        with self.lock:
+            records, self.records = self.records, []
+            self.data_event.clear()
+        return records
+
+    def fetch(self):
+        """前回より新しいレコードを取得して受け取り待ちに追加"""
+        records = self.get_sgv.fetch_since(self.last_date)
+        if not records:
+            return
+        with self.lock:
+            self.last_date = max(self.last_date, records[0][0])
+            self.records = records + self.records
+            self.data_event.set()
+        if self.on_data is not None:
+            self.on_data()
+
+    def _run(self):
+        self.mode = "push"
+        while not self.stop_event.is_set():
+            try:
+                if not self.get_sgv.watch(self.fetch, self.stop_event):
+                    break  # change stream 非対応
+            except self.get_sgv.errors as e:
+                self.get_sgv.failed(e)
+                retry = self.get_sgv.retry_interval()
+                logger.warning(f"change stream error: {e} (retry in {retry:.0f}s)")
+                self.stop_event.wait(retry)
+        if self.stop_event.is_set():
+            return
+
+        self.mode = "poll"
+        while not self.stop_event.is_set():
+            self.fetch()
+            interval = max(
+                self.get_sgv.poll_interval(self.last_date, time.time()),
+                self.get_sgv.retry_interval(),  # 失敗が続く間は間隔を延ばす
+            )
+            logger.debug(f"Next poll in {interval:.0f}s")
+            self.stop_event.wait(interval)
+
+
 class DataStore:
-    def __init__(self, max_records=50):
+    """SGVレコードを保持するリングバッファ
+
+    タイムスタンプ（int64, ミリ秒）と SGV 値（int16）を古い順に固定長の配列で保持する。
+    配列は容量の2倍の長さで、各レコードを i と i + max_records の2か所に書くことで
+    保持中のレコードが常に連続した領域になり、コピーなしのビューで返せる。
+    返したビューは次にレコードを追加するまでの間だけ有効。
+    cache（SGVCache）を渡すと、追加したレコードをファイルにも書き込む。
+    trend（TrendEngine）を渡すと、追加したレコードでトレンドを更新する。
+    rollup（Rollup）を渡すと、追加したレコードを日ごと・時間帯ごとに集計する。
+    """
+
+    def __init__(self, max_records=50, cache=None, trend=None, rollup=None):
         self.max_records = max_records
-        self.records = []  # [[timestamp, sgv], ...]
+        self.cache = cache
+        self.trend = trend
+        self.rollup = rollup
+        self.timestamps = np.zeros(max_records * 2, np.int64)
+        self.values = np.zeros(max_records * 2, np.int16)
+        self.head = 0  # 次に書き込む位置
+        self.count = 0  # 保持しているレコード数
+
+    def __len__(self):
+        return self.count
 
     def init_records(self, records):
-        """初期データのロード"""
+        """初期データのロード（[[timestamp, sgv], ...] 新しい順）"""
         if not records:
             return
-        self.records = records[: self.max_records]
-
-    def add_record(self, record):
-        """新しいレコードを追加し、古いものを削除"""
-        if not record:
-            return False
+        self.head = 0
+        self.count = 0
+        if self.trend is not None:
+            self.trend.reset()
+        if self.rollup is not None:
+            self.rollup.reset()
+        for record in reversed(records[: self.max_records]):
+            self.append(record[0], record[1])
+        self._write_cache(self.count)
+
+    def load_cache(self):
+        """キャッシュファイルから直近のレコードを読み込み、件数を返す"""
+        if self.cache is None:
+            return 0
+        timestamps, values = self.cache.load(self.max_records)
+        for timestamp, sgv in zip(timestamps.tolist(), values.tolist()):
+            self.append(timestamp, sgv)
+        return len(timestamps)
+
+    def _write_cache(self, added):
+        """末尾に追加した added 件をキャッシュファイルに書き込む"""
+        if self.cache is None or not added:
+            return
+        timestamps, values = self.view()
+        try:
+            self.cache.append(timestamps[-added:].tolist(), values[-added:].tolist())
+        except OSError as e:
+            logger.warning(f"SGV cache write failed: {e}")
 
-        # 重複チェック
-        if self.records and record[0] <= self.records[0][0]:
+    def append(self, timestamp, sgv):
+        """最新のレコードより新しいレコードを末尾に追加（O(1)）"""
+        if self.count and timestamp <= self.timestamps[self.head + self.max_records - 1]:
             return False
 
-        # 先頭に追加
-        self.records.insert(0, record)
-
-        # 最大件数を超えた分を削除
-        if len(self.records) > self.max_records:
-            self.records = self.records[: self.max_records]
-
+        i = self.head
+        self.timestamps[i] = self.timestamps[i + self.max_records] = timestamp
+        self.values[i] = self.values[i + self.max_records] = sgv
+        self.head = (i + 1) % self.max_records
+        self.count = min(self.count + 1, self.max_records)
+        if self.trend is not None:
+            self.trend.add(timestamp, sgv)
+        if self.rollup is not None:
+            self.rollup.add(timestamp, sgv)
         return True
 
-    def get_records(self):
-        """保存されているレコードを返す"""
-        return self.records
+    def add_record(self, record):
+        """新しいレコードを追加し、古いものを削除"""
+        if not record:
+            return False
+        added = self.append(record[0], record[1])
+        self._write_cache(int(added))
+        return added
+
+    def add_records(self, records):
+        """複数のレコードをまとめて追加し、追加した件数を返す"""
+        new = {r[0]: r for r in records if r}
+        added = 0
+        for timestamp in sorted(new):
+            if self.append(timestamp, new[timestamp][1]):
+                added += 1
+        self._write_cache(min(added, self.count))
+        return added
+
+    def view(self):
+        """保持している全レコードを (timestamps, values) のビューで返す（古い順）"""
+        end = self.head + self.max_records
+        return self.timestamps[end - self.count:end], self.values[end - self.count:end]
+
+    def range(self, start, end=None):
+        """start 以上 end 未満のレコードのビューを返す（二分探索）"""
+        timestamps, values = self.view()
+        i = np.searchsorted(timestamps, start, "left")
+        j = len(timestamps) if end is None else np.searchsorted(timestamps, end, "left")
+        return timestamps[i:j], values[i:j]
+
+    def latest(self):
+        """最新のレコード [timestamp, sgv]（なければ None）"""
+        if not self.count:
+            return None
+        i = self.head + self.max_records - 1
+        return [int(self.timestamps[i]), int(self.values[i])]
 
 
 # コンテンツの描画
 class DrawContents:
-    def __init__(self, image, framebuffer, sender):
+    def __init__(self, image, framebuffer, sender, rollup=None):
         self.image = image
         self.width = image.width
         self.height = image.height
         self.draw = ImageDraw.Draw(self.image)
         self.framebuffer = framebuffer
         self.sender = sender
+        self.rollup = rollup  # AGP と集計の表示に使う（Rollup）
         self.sgv_color = (255, 255, 255)
-        self.draw_graph = DrawGraph(self.width, 140, (0, 0, 0))
+        self.draw_graph = DrawGraph(self.width, GRAPH_HEIGHT, (0, 0, 0))
+        # 毎回描く文字は先にマスクを作っておく
+        self.text_cache = TextCache()
+        self.text_cache.preload(load_font("sgv"), " 0123456789")
+        self.text_cache.preload(load_font("sgv_s"), "+-0123456789")
+        self.text_cache.preload(load_font("sys"), " -:0123456789hmsMonTueWedThuFriSatSun")
         self.draw_time = None
 
+        # 画面の領域 (x0, y0, x1, y1)
+        self.sgv_box = (0, 0, self.width, GRAPH_TOP)
+        self.graph_box = (0, GRAPH_TOP, self.width, GRAPH_TOP + GRAPH_HEIGHT)
+        self.status_box = (0, self.height - 30, self.width, self.height)
+
+        self.dirty = []  # 前回の表示から変更された領域
+        self.drawn = {}  # 領域ごとの描画済みの内容
+        self.shown_msg = None  # 表示中のメッセージ（同じなら描き直さない）
+        self.frames_skipped = 0  # 内容が変わらず表示を省略した回数
+
+    def mark_dirty(self, box):
+        """変更された領域を記録"""
+        self.dirty.append(box)
+
+    def is_changed(self, key, state):
+        """領域の内容が前回の描画から変化したか（変化していれば記録を更新）"""
+        if self.drawn.get(key) == state:
+            return False
+        self.drawn[key] = state
+        return True
+
+    def skip_frame(self):
+        """表示内容が変わらず、書き込みと送信を省略したことを記録"""
+        self.frames_skipped += 1
+        METRICS.count("frame_skipped")
+
     def display(self):
-        self.framebuffer.write_image(self.image)
+        if not self.dirty:  # 見た目が同じなら書き込みも送信もしない
+            self.skip_frame()
+            return
+        with METRICS.stage("fb_write"):
+            self.framebuffer.write_image(self.image, self.dirty)
         self.sender.send_image(self.image)
+        self.dirty = []
 
     def clear(self, color=(0, 0, 0)):
         # 表示エリアのクリア
         self.draw.rectangle((0, 0, self.image.width, self.image.height), fill=color)
+        self.mark_dirty((0, 0, self.width, self.height))
+        self.drawn = {}
 
     def draw_msg_center(self, msg, font, color, bg_color):
+        state = (msg, font.path, font.size, color, bg_color)
+        if state == self.shown_msg:  # 同じメッセージを表示中
+            self.skip_frame()
+            return
         self.clear(bg_color)
         # テキストのバウンディングボックスを取得（0,0を基準に）
         bbox = self.draw.textbbox((0, 0), msg, font=font)
@@ -154,18 +691,25 @@ class DrawContents:
 
         self.draw.text((x, y), msg, fill=color, font=font)
         self.display()
+        self.shown_msg = state
+
+    def draw_sgv(self, sgv, old_sgv, trend=None):
+        # SGVの描画（値とトレンドの矢印が変わらなければ前回の描画を残す）
+        arrow = trend.arrow if trend is not None else None
+        if not self.is_changed("sgv", (sgv, old_sgv, arrow)):
+            return False
+        self.draw.rectangle(self.sgv_box, fill=(0, 0, 0))
+        self.mark_dirty(self.sgv_box)
 
-    def draw_sgv(self, sgv, old_sgv):
-        # SGVの描画
         sgv_color = (255, 255, 255)
         if sgv >= 200:
             sgv_color = (255, 0, 0)
 
         # -self.image.paste((0, 0, 0), (0, 0, self.width, self.height))
         sgv_str = f"{sgv:3d}"
-        bbox = self.draw.textbbox((0, 0), sgv_str, font=FONT_SGV)
+        bbox = self.text_cache.textbbox((0, 0), sgv_str, load_font("sgv"))
         text_width = bbox[2] - bbox[0]
-        self.draw.text((20, 20), sgv_str, fill=sgv_color, font=FONT_SGV)
+        self.text_cache.draw_text(self.image, (20, 20), sgv_str, load_font("sgv"), sgv_color)
 
         # 差分色の決定
         if old_sgv == -1:  # アプリ起動初回は白にする
@@ -188,20 +732,56 @@ class DrawContents:
             # 差分値の描画（SGV値の右側）
             x = 20 + text_width + 10  # SGV値の右端から10ピクセル空けて
             y = 20 + 70
-            self.draw.text((x, y), diff_str, fill=sgv_diff_color, font=FONT_SGV_S)
+            self.text_cache.draw_text(
+                self.image, (x, y), diff_str, load_font("sgv_s"), sgv_diff_color
+            )
+
+        # トレンドの矢印（差分の上）
+        if arrow is not None:
+            self.draw_arrow((20 + text_width + 40, 55), 50, arrow)
+        return True
 
-    def draw_datetime(self):
+    def draw_arrow(self, center, size, arrow):
+        """トレンドの矢印を図形で描く（フォントに矢印の文字がなくても描けるように）"""
+        angle = math.radians(ARROW_ANGLES[arrow])
+        if angle > 0:
+            color = (255, 128, 128)  # 上昇は赤
+        elif angle < 0:
+            color = (128, 128, 255)  # 下降は青
+        else:
+            color = (255, 255, 255)
+        double = arrow.startswith("Double")
+        length = size * 0.9 if double else size
+        shaft, head, head_width = length * 0.1, length * 0.4, length * 0.3
+        # 右向きの矢印の頂点（中心が原点）
+        tip = length / 2
+        points = [
+            (-tip, -shaft), (tip - head, -shaft), (tip - head, -head_width), (tip, 0),
+            (tip - head, head_width), (tip - head, shaft), (-tip, shaft),
+        ]
+        cos, sin = math.cos(angle), math.sin(angle)
+        for offset in ((-size * 0.3, size * 0.3) if double else (0,)):
+            self.draw.polygon(
+                [
+                    (center[0] + x * cos + (y + offset) * sin,
+                     center[1] - x * sin + (y + offset) * cos)
+                    for x, y in points
+                ],
+                fill=color,
+            )
+
+    def draw_datetime(self, current_time=None):
         # 日時の描画
-        self.draw.rectangle(
-            (0, self.height - 30, self.width, self.height), fill=(0, 0, 200)
-        )
-        current_time = datetime.now()
+        self.draw.rectangle(self.status_box, fill=(0, 0, 200))
+        self.mark_dirty(self.status_box)
+        if current_time is None:
+            current_time = datetime.now()
         weekday = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"][
             current_time.weekday()
         ]
         date_str = current_time.strftime(f"%Y-%m-%d {weekday} %H:%M:%S")
-        self.draw.text(
-            (10, self.height - 25), date_str, fill=(200, 200, 200), font=FONT_SYS
+        self.text_cache.draw_text(
+            self.image, (10, self.height - 25), date_str, load_font("sys"), (200, 200, 200)
         )
 
     def draw_pass_time(self, seconds_pass):
@@ -216,18 +796,45 @@ class DrawContents:
             str_pass_time = f"{seconds_pass}s"
 
         # 経過時間の描画（右詰め）
-        bbox = self.draw.textbbox((0, 0), str_pass_time, font=FONT_SYS)
+        bbox = self.text_cache.textbbox((0, 0), str_pass_time, load_font("sys"))
         x = self.width - bbox[2] + bbox[0] - 10
-        self.draw.text(
-            (x, self.height - 25), str_pass_time, fill=(200, 200, 200), font=FONT_SYS
+        self.text_cache.draw_text(
+            self.image, (x, self.height - 25), str_pass_time, load_font("sys"), (200, 200, 200)
         )
 
-    def update(self, sgv, old_sgv, data, seconds_pass):
-        if seconds_pass > 10 * 60:  # 10分以上経過
+    def draw_agp(self):
+        """グラフの領域に AGP と集計（今日と ROLLUP_DAYS 日）を描く"""
+        period = self.rollup.summary(ROLLUP_DAYS)
+        today = self.rollup.summary(1)
+        img_agp = self.draw_graph.create_agp(self.rollup.agp())
+        self.image.paste(img_agp, self.graph_box[:2])
+        lines = [
+            f"{ROLLUP_DAYS}d TIR {period['tir'] * 100:.0f}% Avg {period['mean']:.0f} "
+            f"GMI {period['gmi']:.1f}%",
+            f"Today TIR {today['tir'] * 100:.0f}% Avg {today['mean']:.0f}",
+        ]
+        for i, line in enumerate(lines):
+            self.text_cache.draw_text(
+                self.image, (10, self.graph_box[1] + 4 + i * 26), line, load_font("sys"),
+                (200, 200, 200)
+            )
+
+    def show_agp(self, current_time):
+        """AGP を表示する時刻か（AGP_VIEW_SECONDS 秒ごとにグラフと切り替える）"""
+        if self.rollup is None or not AGP_VIEW_SECONDS or self.rollup.last_date is None:
+            return False
+        return int(current_time.timestamp()) // AGP_VIEW_SECONDS % 2 == 1
+
+    def invalidate(self):
+        """次の update() で時刻が変わっていなくても描画する"""
+        self.draw_time = None
+
+    def update(self, sgv, old_sgv, data, seconds_pass, trend=None):
+        if seconds_pass > STALE_SECONDS:  # 10分以上経過
             # データが古い場合はエラー表示
             self.draw_msg_center(
                 f"Data Error\n{seconds_pass//60} minutes passed",
-                FONT_SGV_S,
+                load_font("sgv_s"),
                 (255, 255, 255),  # 白文字
                 (128, 0, 0),  # 暗い赤背景
             )
@@ -237,19 +844,39 @@ class DrawContents:
         current_time = datetime.now().replace(microsecond=0)
         if current_time == self.draw_time:
             logger.debug(f"Skip Drawing: {current_time} == {self.draw_time}")
+            self.skip_frame()
             return
         logger.debug(f"Drawing: {current_time} != {self.draw_time}")
         self.draw_time = current_time
 
-        # 描画
-        self.clear()
-        self.draw_sgv(sgv, old_sgv)
-        self.draw_datetime()
-        self.draw_pass_time(seconds_pass)
-
-        # グラフの描画
-        img_graph = self.draw_graph.create_graph(data)
-        self.image.paste(img_graph, (0, 150))
+        # 描画（変化した領域だけを描き直す）
+        if not self.drawn or self.shown_msg is not None:  # 初回・メッセージ表示後は全体を描き直す
+            self.clear()
+            self.shown_msg = None
+        with METRICS.stage("draw_text"):
+            sgv_changed = self.draw_sgv(sgv, old_sgv, trend)
+            # 下の行は時刻と経過時間が変わった時だけ描き直す
+            if self.is_changed("status", (current_time, seconds_pass)):
+                self.draw_datetime(current_time)
+                self.draw_pass_time(seconds_pass)
+
+        # グラフの描画（SGVの文字がはみ出した部分もグラフで上書きする）
+        timestamps, values = data
+        forecast = None  # 予測線（最新のレコードから予測値まで）
+        if trend is not None and trend.timestamp == int(timestamps[-1]):
+            forecast = ((trend.timestamp, trend.sgv), (trend.forecast_time, trend.forecast))
+        graph_state = (int(timestamps[0]), int(timestamps[-1]), len(timestamps), forecast)
+        agp = self.show_agp(current_time)
+        if agp:
+            graph_state = ("agp", self.rollup.version)
+        if self.is_changed("graph", graph_state) or sgv_changed:
+            with METRICS.stage("graph"):
+                if agp:
+                    self.draw_agp()
+                else:
+                    img_graph = self.draw_graph.create_graph(timestamps, values, forecast)
+                    self.image.paste(img_graph, self.graph_box[:2])
+            self.mark_dirty(self.graph_box)
 
         self.display()
 
@@ -257,31 +884,159 @@ class DrawContents:
 # メイン処理クラス
 class SGVMonitor:
     def __init__(self):
+        # 起動処理の段階ごとの所要時間（最初のSGVを表示した時にログ出力）
+        self.startup = PhaseTimer(STARTUP_TIME)
+        self.startup.mark("imports")
         self.image = Image.new("RGB", (DISP_WIDTH, DISP_HEIGHT), (0, 0, 0))
         self.sgv = -1
         self.old_sgv = -1
-        self.last_data_read = 0
         self.last_record_time = 0
-        self.get_sgv = GetSGV()
-        self.data_store = DataStore(MAX_RECORDS)
-
-        self.framebuffer = Framebuffer()
-        self.framebuffer.open()
-        self.sender = ImageSender(NETVIEW_HOST)
-        self.draw_contents = DrawContents(self.image, self.framebuffer, self.sender)
-        self.draw_contents.draw_msg_center(
-            "Hello", FONT_SGV, (255, 255, 255), (0, 0, 200)
+        self.get_sgv = None
+        self.init_records = []
+        self.load_error = None
+        self.connected = threading.Event()  # 取得元の作成（pymongo の読み込み等）が終わった
+        self.loaded = False  # 初期データの待ちを終えた
+
+        with self.startup.phase("framebuffer"):
+            self.framebuffer = Framebuffer(device=FB_DEVICE)
+            self.framebuffer.open()
+        with self.startup.phase("splash"):
+            splash_cached = show_splash(self.framebuffer)
+
+        # 前回までのレコードをローカルのキャッシュから読み込む（取得元からは差分だけ取得）
+        with self.startup.phase("local_history"):
+            self.rollup = Rollup(ROLLUP_DAYS)
+            self.data_store = DataStore(
+                MAX_RECORDS, self._open_cache(), TrendEngine(), self.rollup
+            )
+            loaded = self.data_store.load_cache()
+        logger.info(f"{loaded} records loaded from cache")
+
+        # 取得元への接続と初期データの取得は、フォントの読み込み等と並行して行う
+        loader = threading.Thread(target=self._connect, name="sgvload", daemon=True)
+        loader.start()
+
+        # 送信は別スレッドで行い、描画ループをネットワークで止めない
+        senders = [
+            ImageSender(
+                NETVIEW_HOST,
+                NETVIEW_PORT,
+                persistent=NETVIEW_PERSISTENT,
+                encoding=NETVIEW_ENCODING,
+                metrics=METRICS,
+            )
+        ]
+        if NETVIEW_PUBLISH_PORT:
+            publisher = ImagePublisher(
+                port=int(NETVIEW_PUBLISH_PORT),
+                encoding=NETVIEW_ENCODING,
+                metrics=METRICS,
+            )
+            publisher.start()  # ポートが使えない場合は起動時にエラーにする
+            senders.append(publisher)
+        if WEBVIEW_PORT:
+            web_stream = WebStreamServer(
+                WEBVIEW_HOST, int(WEBVIEW_PORT), quality=WEBVIEW_JPEG_QUALITY, metrics=METRICS
+            )
+            web_stream.start()  # 最初のフレームより前から待ち受ける
+            senders.append(web_stream)
+        self.sender = BackgroundSender(*senders)
+        self.sender.start()
+        with self.startup.phase("fonts"):
+            self.draw_contents = DrawContents(
+                self.image, self.framebuffer, self.sender, self.rollup
+            )
+        if not splash_cached:  # 初回は描画してキャッシュする
+            self.draw_contents.draw_msg_center(
+                "Hello", load_font("sgv"), (255, 255, 255), (0, 0, 200)
+            )
+            save_splash(self.framebuffer)
+
+        # 初期データは MONGO_STARTUP_WAIT 秒まで待ち、間に合わなければ SGVWatcher に任せる
+        with self.startup.phase("wait_source"):
+            self.connected.wait()
+            loader.join(MONGO_STARTUP_WAIT)
+        if self.load_error is not None:
+            raise self.load_error
+        if loader.is_alive():
+            logger.warning("SGV source is not responding; starting without initial data")
+        self.loaded = True
+        self._load_initial_data()
+        self.scheduler = Scheduler()
+        self.watcher = SGVWatcher(
+            self.get_sgv, self.last_record_time, on_data=self.scheduler.notify
         )
+        self.watcher.start()
+        if ROLLUP_BOOTSTRAP:  # 表示を始めてから行う（起動を遅らせない）
+            threading.Thread(target=self._bootstrap_rollup, name="rollup", daemon=True).start()
+
+    def _bootstrap_rollup(self):
+        """手元のレコードより前の ROLLUP_DAYS 日分の集計を取得元から取得する"""
+        until = self.rollup.first_date
+        if until is None:  # レコードがない場合は SGVWatcher が取得した分で集計する
+            return
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        since = int(today.timestamp() * 1000) - (ROLLUP_DAYS - 1) * 24 * HOUR
+        if until <= since:
+            return
+        try:
+            docs = self.get_sgv.rollup_hours(since, until, self.rollup.bin_width)
+        except self.get_sgv.errors as e:
+            logger.warning(f"rollup bootstrap failed: {e}")
+            self.get_sgv.failed(e)
+            return
+        if docs is None:
+            return
+        added = self.rollup.merge_hours(docs)
+        logger.info(f"Rollup: {added} records aggregated by the source")
 
-        self._load_initial_data()
+    @staticmethod
+    def _open_cache():
+        """SGVキャッシュを開く（無効・開けない場合は None）"""
+        if not SGV_CACHE:
+            return None
+        cache = SGVCache(os.path.join(CACHE_DIR, "sgv.bin"), MAX_RECORDS)
+        try:
+            cache.open()
+        except OSError as e:
+            logger.warning(f"SGV cache is not available: {e}")
+            return None
+        return cache
+
+    def _connect(self):
+        """取得元への接続と初期データの取得（起動時に別スレッドで行う）
+
+        キャッシュにレコードがある場合は取得しない（差分は SGVWatcher が取得する）。
+        """
+        try:
+            with self.startup.phase("connect"):
+                self.get_sgv = create_source()
+        except Exception as e:
+            self.load_error = e
+            return
+        finally:
+            self.connected.set()
+        if len(self.data_store):
+            return
+
+        with self.startup.phase("history"):
+            try:
+                records = self.get_sgv.init_sgv_docs(GRAPH_RECORDS)
+            except self.get_sgv.errors as e:
+                # 接続できなくても起動する（SGVWatcher が再接続して取得する）
+                logger.warning(f"init_sgv_docs failed: {e}")
+                self.get_sgv.failed(e)
+                return
+        if not self.loaded:  # 待ち時間を過ぎて届いた場合は使わない
+            self.init_records = records
 
     def _load_initial_data(self):
         """初期データの読み込み"""
-        init_records = self.get_sgv.init_sgv_docs(MAX_RECORDS)
-        self.data_store.init_records(init_records)
-        if init_records:  # 初期データがある場合
-            self.sgv = init_records[0][1]  # 最新のSGVを設定
-            self.last_record_time = init_records[0][0]
+        self.data_store.init_records(self.init_records)
+        record = self.data_store.latest()
+        if record:  # 初期データがある場合
+            self.sgv = record[1]  # 最新のSGVを設定
+            self.last_record_time = record[0]
         logger.info(f"Initial data loaded: {self.sgv}")
 
     def _pass_time(self, record_time):
@@ -293,21 +1048,20 @@ class SGVMonitor:
         return int(diff_date.total_seconds())
 
     def update_data(self):
-        """データの更新（1秒に1回）"""
-        current_time = time.time()
-        if current_time - self.last_data_read < 1.0:  # 1秒経過していない
-            return
-
-        record = self.get_sgv.last_sgv_doc()
-        if not record:
+        """データの更新（SGVWatcher に届いたレコードを取り込む）"""
+        records = self.watcher.take_records()
+        if not records:
             return
 
         # データストアに追加（重複チェックも行われる）
-        result = self.data_store.add_record(record)
-        if not result:
+        added = self.data_store.add_records(records)
+        if not added:
             return
+        self.draw_contents.invalidate()  # 秒の途中でもすぐに表示する
+        if added > 1:
+            logger.info(f"{added} records added")
 
-        self.last_data_read = current_time
+        record = self.data_store.latest()
         record_time = record[0]
 
         # sgv取得
@@ -317,45 +1071,84 @@ class SGVMonitor:
         # SGV値が変化した場合にログ出力
         if self.sgv != read_sgv:
             logger.info(f"SGV changed: {self.sgv} -> {read_sgv}")
+        logger.debug(f"Trend: {self.data_store.trend.current()}")
         self.sgv = read_sgv
         self.last_record_time = record_time
 
     def update(self):
         """フレームの更新"""
         self.update_data()  # データの更新と鮮度チェック
-        if not self.data_store.get_records():  # データがない場合はスキップ
+        if not len(self.data_store):  # データがない場合はスキップ
             return
 
         seconds_pass = self._pass_time(self.last_record_time)
         self.draw_contents.update(
             self.sgv,
             self.old_sgv,
-            self.data_store.get_records(),  # 保存されている全レコードを渡す
+            # グラフの表示期間のレコード（コピーなしのビュー）
+            self.data_store.range(self.last_record_time - GRAPH_SPAN),
             seconds_pass,
+            self.data_store.trend.current(),
         )
+        if self.startup is not None:  # 最初のSGVを表示するまでの時間
+            self.startup.mark("first_sgv")
+            logger.info(f"Startup: {self.startup.format()}")
+            self.startup = None
+
+    def schedule_next(self):
+        """次に画面を更新する時刻をタイマーに登録"""
+        if not len(self.data_store):  # データが届くまで（notify まで）待つ
+            self.scheduler.cancel("draw")
+            return
+
+        now = time.time()
+        record_time = self.last_record_time / 1000
+        if now - record_time > STALE_SECONDS:
+            # エラー表示中は経過分数が変わる時だけ
+            passed = int((now - record_time) // 60) + 1
+            self.scheduler.reschedule(record_time + passed * 60, "draw")
+        else:
+            # 時計の秒が変わる瞬間（データが古くなる時刻も秒の境目になる）
+            self.scheduler.reschedule(int(now) + 1, "draw")
 
     def term_proc(self):
         # 画面クリア
         self.draw_contents.clear()
         self.draw_contents.draw_msg_center(
-            "Terminate", FONT_SGV_S, (255, 255, 255), (0, 0, 0)
+            "Terminate", load_font("sgv_s"), (255, 255, 255), (0, 0, 0)
         )
         self.framebuffer.write_image(self.image)
+        self.sender.stop()
+        logger.info(f"NetView stats: {self.sender.stats()}")
+        self.watcher.stop()
         self.get_sgv.close()
+        if self.data_store.cache is not None:
+            self.data_store.cache.close()
 
 
 def main():
     """メイン関数"""
     sgv_monitor = SGVMonitor()
+    scheduler = sgv_monitor.scheduler
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(METRICS, METRICS_HOST, int(METRICS_PORT))
+        metrics_server.start()
     frame_count = 0
     fps_update_time = time.time()
+    metrics_log_time = time.time()
     logger.info("Start Main Loop")
     try:
         while True:
+            # 次の描画時刻かデータの到着まで眠る
+            sgv_monitor.schedule_next()
+            reasons = scheduler.wait()
             loop_start = time.time()
+            logger.debug(f"Wakeup: {reasons} (+{(loop_start % 1) * 1000:.1f}ms)")
 
             # メイン処理
-            sgv_monitor.update()
+            with METRICS.stage("frame"):
+                sgv_monitor.update()
 
             # FPS計算（1秒ごとに更新）
             frame_count += 1
@@ -365,17 +1158,23 @@ def main():
                 frame_count = 0
                 fps_update_time = current_time
                 logger.debug(f"FPS: {fps}")
+                logger.debug(f"NetView: {sgv_monitor.sender.stats()}")
+                logger.debug(f"SGV source: {sgv_monitor.get_sgv.stats()}")
+                logger.debug(f"TextCache: {sgv_monitor.draw_contents.text_cache.stats()}")
+                logger.debug(f"Skipped frames: {sgv_monitor.draw_contents.frames_skipped}")
 
-            # 次のフレームまでスリープ
             process_time = (time.time() - loop_start) * 1000  # 秒からミリ秒に変換
             logger.debug(f"Process time: {process_time:.2f}ms")
-            sleep_time = max(
-                0, FRAME_TIME - (process_time / 1000)
-            )  # ミリ秒から秒に戻して計算
-            time.sleep(sleep_time)
+
+            # 処理段階ごとの所要時間を定期的にログ出力
+            if METRICS_LOG_INTERVAL and current_time - metrics_log_time >= METRICS_LOG_INTERVAL:
+                metrics_log_time = current_time
+                logger.info(f"Timing: {METRICS.format_summary()}")
 
     except:
         logger.info("--stop--")
+        if metrics_server is not None:
+            metrics_server.stop()
         sgv_monitor.term_proc()
 
 
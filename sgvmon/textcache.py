@@ -0,0 +1,89 @@
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw
+
+
+class TextCache:
+    """文字ごとのマスク画像をキャッシュして文字列を描画するクラス
+
+    FreeType によるラスタライズは文字ごとに1回だけ行い、以降は
+    キャッシュしたマスク（グレースケール）で色を貼り付ける。
+    キーは (フォントファイル, サイズ, 文字)。マスクは色によらないため、
+    同じ文字は色が違っても共有する。
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (mask, left, top, right, bottom, advance)
+        self.hits = 0
+        self.misses = 0
+
+    def glyph(self, font, ch):
+        """
+        文字のマスクと位置情報を返す（なければ描画してキャッシュする）
+        :param font: ImageFont.FreeTypeFont
+        :param ch: 文字
+        :return: (mask, left, top, right, bottom, advance)
+        """
+        key = (font.path, font.size, ch)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        left, top, right, bottom = font.getbbox(ch)
+        mask = None
+        if right > left and bottom > top:
+            mask = Image.new('L', (right - left, bottom - top), 0)
+            ImageDraw.Draw(mask).text((-left, -top), ch, fill=255, font=font)
+        entry = (mask, left, top, right, bottom, font.getlength(ch))
+        self.entries[key] = entry
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def preload(self, font, chars):
+        """よく使う文字を先に描画しておく"""
+        for ch in chars:
+            self.glyph(font, ch)
+
+    def textbbox(self, xy, text, font):
+        """ImageDraw.textbbox と同じ形式 (left, top, right, bottom) で文字列の範囲を返す"""
+        x, y = xy
+        left = top = right = bottom = None
+        pen = x
+        for ch in text:
+            # 空白も含める（font.getbbox と同じく、先頭の空白の分も左端は基準位置から）
+            _, gl, gt, gr, gb, advance = self.glyph(font, ch)
+            gx = round(pen)
+            left = gx + gl if left is None else min(left, gx + gl)
+            right = gx + gr if right is None else max(right, gx + gr)
+            top = y + gt if top is None else min(top, y + gt)
+            bottom = y + gb if bottom is None else max(bottom, y + gb)
+            pen += advance
+        if left is None:  # 空文字列
+            return (x, y, x, y)
+        return (left, top, right, bottom)
+
+    def draw_text(self, image, xy, text, font, fill):
+        """
+        文字列を描画する（ImageDraw.text と同じく xy は左上の基準位置）
+        :param image: 描画先の PIL Image
+        :param xy: 描画位置 (x, y)
+        :param text: 文字列（1行）
+        :param font: ImageFont.FreeTypeFont
+        :param fill: 文字色
+        """
+        x, y = xy
+        pen = x
+        for ch in text:
+            mask, gl, gt, gr, gb, advance = self.glyph(font, ch)
+            if mask is not None:
+                image.paste(fill, (round(pen) + gl, round(y) + gt), mask)
+            pen += advance
+
+    def stats(self):
+        """キャッシュの統計"""
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
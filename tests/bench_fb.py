@@ -0,0 +1,54 @@
+import sys
+import os
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../sgvmon/lib')))
+from fb import Framebuffer
+
+WIDTH = 480
+HEIGHT = 320
+FRAMES = 20
+
+
+def legacy_write_image(fb, img):
+    """変更前の write_image（1ピクセルずつ R と B を交換）"""
+    rgba_data = img.convert('RGBA').tobytes()
+    bgra_data = bytearray(rgba_data)
+    for i in range(0, len(bgra_data), 4):
+        bgra_data[i], bgra_data[i + 2] = bgra_data[i + 2], bgra_data[i]
+    fb.fb[:] = bgra_data
+
+
+def measure(func, fb, img, frames):
+    """frames 回書き込んで fps を返す"""
+    start = time.perf_counter()
+    for _ in range(frames):
+        func(fb, img)
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    # /dev/fb0 の代わりにファイルを使う
+    with tempfile.NamedTemporaryFile() as dev:
+        dev.truncate(WIDTH * HEIGHT * 4)
+        fb = Framebuffer(WIDTH, HEIGHT, device=dev.name)
+        fb.open()
+
+        img = Image.new('RGB', (WIDTH, HEIGHT), (0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((20, 20, 200, 120), fill=(255, 0, 0))
+        draw.line([(0, 200), (WIDTH, 250)], fill=(0, 255, 0), width=5)
+
+        before = measure(legacy_write_image, fb, img, FRAMES)
+        after = measure(Framebuffer.write_image, fb, img, FRAMES * 50)
+        fb.close()
+
+    print(f"before: {before:8.1f} fps")
+    print(f"after : {after:8.1f} fps  (x{after / before:.0f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from sgvmon.drawgraph import DrawGraph
+from helpers import create_history
+
+REPEAT = 50
+
+
+def main():
+    graph = DrawGraph(480, 140, (0, 0, 0))
+    for label, count in (('50 points', 50), ('24 hours', 288), ('14 days', 14 * 288)):
+        timestamps, values = create_history(count, spike_at=count // 2)
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            graph.drawn_data = None  # 同じデータでも毎回描き直す
+            graph.create_graph(timestamps, values)
+        elapsed = (time.perf_counter() - start) / REPEAT * 1000
+        print(f"{label:10s}: {elapsed:6.2f} ms/graph")
+
+
+if __name__ == '__main__':
+    main()
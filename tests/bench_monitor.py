@@ -0,0 +1,218 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import contextlib
+import functools
+import json
+import math
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+import conftest  # sgvmon.py の読み込みに必要な設定
+from helpers import FakeEntries, FakeClient
+import sgvmon.sgvmon as monitor
+from sgvmon.sgvmon import GetSGV
+from sgvmon.lib.metrics import Metrics
+from sgvmon.lib.nvsend import ImageReceiver, BackgroundSender
+
+# SGVMonitor を実機なしで動かし、1時間分（1秒ごとの更新）の処理量を計測する
+#   フレームバッファ: 通常のファイル（mmap）
+#   MongoDB: helpers の FakeEntries（合成したCGMデータ）
+#   ビューア: 同じプロセス内の ImageReceiver（受信バイト数を数えるだけ）
+#   時計: 1回の更新ごとに1秒進める（sgvmon の datetime を差し替え）
+# 結果は JSON で出力するため、コミット間で比較できる。
+
+START_TIME = datetime(2025, 6, 11, 12, 0, 0).timestamp()
+HISTORY_DAYS = 14
+SEED = 1
+
+
+class SimClock:
+    now = START_TIME
+
+
+class SimDatetime(datetime):
+    """now() がシミュレーション時刻を返す datetime"""
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fromtimestamp(SimClock.now, tz)
+
+
+class CountingSender(BackgroundSender):
+    """渡されたフレーム数を数え、送り終えるまで待てる BackgroundSender"""
+
+    def __init__(self, *senders):
+        super().__init__(*senders)
+        self.submitted = 0
+
+    def send_image(self, img):
+        self.submitted += 1
+        super().send_image(img)
+
+    def drain(self):
+        """送信スレッドが送り終えるまで待つ（実機では次の更新まで1秒ある）"""
+        while True:
+            s = self.stats()
+            if s['sent'] + s['failed'] + s['dropped'] >= self.submitted * len(self.workers):
+                return
+            time.sleep(0.0002)
+
+
+def synthetic_sgv(t, rng):
+    """合成したCGMの値（食事の山 + 日内変動 + ノイズ）"""
+    value = (130 + 50 * math.sin(2 * math.pi * t / (4 * 3600))
+             + 20 * math.sin(2 * math.pi * t / 86400) + rng.gauss(0, 4))
+    return int(min(max(value, 40), 400))
+
+
+def seed_entries(entries, rng):
+    """起動前の HISTORY_DAYS 日分のデータを登録"""
+    count = HISTORY_DAYS * 86400 // monitor.CGM_INTERVAL
+    for i in range(count, -1, -1):
+        t = START_TIME - i * monitor.CGM_INTERVAL
+        entries.docs.append({'date': int(t * 1000), 'sgv': synthetic_sgv(t, rng)})
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_viewer(port):
+    """ImageReceiver を別スレッドで動かし、待ち受けを始めるまで待つ"""
+    receiver = ImageReceiver('127.0.0.1', port)
+
+    def run():
+        for _ in receiver.receive_frames():
+            pass
+
+    threading.Thread(target=run, name='viewer', daemon=True).start()
+    deadline = time.time() + 5
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return receiver
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(hours, encoding):
+    frames = int(hours * 3600)
+    rng = random.Random(SEED)
+    entries = FakeEntries(change_stream=False)
+    seed_entries(entries, rng)
+    port = free_port()
+    receiver = start_viewer(port)
+
+    fb_file = tempfile.NamedTemporaryFile(prefix='fb')
+    fb_file.truncate(monitor.DISP_WIDTH * monitor.DISP_HEIGHT * 4)
+    fb_file.flush()
+    cache_dir = tempfile.TemporaryDirectory(prefix='sgvmon')
+
+    # sgvmon の設定と依存先を差し替える
+    monitor.FB_DEVICE = fb_file.name
+    monitor.NETVIEW_HOST = '127.0.0.1'
+    monitor.NETVIEW_PORT = port
+    monitor.NETVIEW_PERSISTENT = True
+    monitor.NETVIEW_ENCODING = encoding
+    monitor.NETVIEW_PUBLISH_PORT = None
+    monitor.CACHE_DIR = cache_dir.name
+    monitor.ROLLUP_BOOTSTRAP = False  # FakeEntries は集計パイプラインに対応しない
+    monitor.GetSGV = functools.partial(GetSGV, FakeClient(entries))
+    monitor.datetime = SimDatetime
+    monitor.BackgroundSender = CountingSender
+    metrics = monitor.METRICS = Metrics(window=frames + 1)
+    SimClock.now = START_TIME
+
+    sgv_monitor = monitor.SGVMonitor()
+    # データの到着は watcher.fetch() を直接呼んで再現する
+    sgv_monitor.watcher.stop()
+    sender = sgv_monitor.sender
+    sender.drain()
+    before = sender.stats()
+    bytes_start = receiver.bytes_received
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(1, frames + 1):
+        SimClock.now = START_TIME + i
+        if i % monitor.CGM_INTERVAL == 0:
+            entries.insert(int(SimClock.now * 1000), synthetic_sgv(SimClock.now, rng))
+            sgv_monitor.watcher.fetch()
+        with metrics.stage('frame'):
+            sgv_monitor.update()
+        sender.drain()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    # 受信側が読み終えるまで待つ
+    deadline = time.time() + 5
+    stats = sender.stats()
+    while receiver.frames_received < stats['sent'] and time.time() < deadline:
+        time.sleep(0.01)
+    bytes_sent = receiver.bytes_received - bytes_start
+
+    sgv_monitor.sender.stop()
+    sgv_monitor.framebuffer.close()
+    fb_file.close()
+    cache_dir.cleanup()
+
+    return {
+        'commit': git_commit(),
+        'encoding': encoding,
+        'simulated_hours': hours,
+        'updates': frames,
+        'frames_displayed': stats['sent'] + stats['failed'] - before['sent'] - before['failed'],
+        'frames_failed': stats['failed'] - before['failed'],
+        'frames_dropped': stats['dropped'] - before['dropped'],
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(cpu, 3),
+        'cpu_seconds_per_hour': round(cpu / hours, 3),
+        'bytes_sent': bytes_sent,
+        'bytes_sent_per_hour': int(bytes_sent / hours),
+        'stages_ms': {
+            name: {key: round(value * 1000, 3) if key != 'count' else value
+                   for key, value in s.items()}
+            for name, s in metrics.summary().items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SGVMonitor のヘッドレスベンチマーク')
+    parser.add_argument('--hours', type=float, default=1.0, help='シミュレーションする時間')
+    parser.add_argument('--encoding', choices=['png', 'tile'], default='png')
+    parser.add_argument('--output', help='結果の JSON を書き出すファイル（省略時は標準出力）')
+    args = parser.parse_args()
+
+    # 受信側の表示などが結果の JSON に混ざらないようにする
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run(args.hours, args.encoding)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
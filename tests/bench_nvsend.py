@@ -0,0 +1,102 @@
+import sys
+import os
+import io
+import socket
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../sgvmon/lib')))
+from nvsend import TileEncoder, ImageReceiver
+
+WIDTH = 480
+HEIGHT = 320
+FRAMES = 60
+RECV_FRAMES = 200
+RECV_SIZE = WIDTH * HEIGHT * 3  # 非圧縮の全画面相当
+FONT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../fonts/tsuchigumo.regular.otf'))
+
+
+def create_frames():
+    """時計だけが変化するフレームを作る"""
+    font = ImageFont.truetype(FONT_PATH, 24)
+    img = Image.new('RGB', (WIDTH, HEIGHT), (0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.line([(0, 280), (WIDTH, 160)], fill=(0, 128, 0), width=5)
+    draw.text((20, 20), '123', fill=(255, 255, 255), font=ImageFont.truetype(FONT_PATH, 150))
+    start = datetime(2025, 6, 11, 12, 0, 0)
+    frames = []
+    for i in range(FRAMES):
+        draw.rectangle((0, HEIGHT - 30, WIDTH, HEIGHT), fill=(0, 0, 200))
+        now = (start + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S')
+        draw.text((10, HEIGHT - 25), now, fill=(200, 200, 200), font=font)
+        frames.append(img.copy())
+    return frames
+
+
+def measure(encode, frames):
+    """エンコード時間（ms/frame）と平均サイズ（bytes/frame）を返す"""
+    total = 0
+    start = time.perf_counter()
+    for img in frames:
+        out = io.BytesIO()
+        encode(img, out)
+        total += out.tell()
+    elapsed = time.perf_counter() - start
+    return elapsed / len(frames) * 1000, total // len(frames)
+
+
+def legacy_read_frames(conn):
+    """変更前の受信処理（received += chunk）"""
+    while True:
+        size_data = conn.recv(4)
+        if len(size_data) < 4:
+            return
+        size = struct.unpack('!I', size_data)[0]
+        received = b''
+        while len(received) < size:
+            chunk = conn.recv(min(4096, size - len(received)))
+            if not chunk:
+                return
+            received += chunk
+        yield received
+
+
+def measure_receive(read_frames):
+    """socketpair 上で RECV_FRAMES 枚受信し、frames/sec を返す"""
+    sock_send, sock_recv = socket.socketpair()
+    frame = struct.pack('!I', RECV_SIZE) + os.urandom(RECV_SIZE)
+
+    def send():
+        for _ in range(RECV_FRAMES):
+            sock_send.sendall(frame)
+        sock_send.close()
+
+    t = threading.Thread(target=send)
+    start = time.perf_counter()
+    t.start()
+    count = sum(1 for _ in read_frames(sock_recv))
+    elapsed = time.perf_counter() - start
+    t.join()
+    sock_recv.close()
+    return count / elapsed
+
+
+def main():
+    frames = create_frames()
+    png_ms, png_bytes = measure(lambda img, out: img.save(out, format='PNG'), frames)
+    tile_ms, tile_bytes = measure(TileEncoder().encode, frames)
+    print(f"png : {png_ms:6.2f} ms/frame {png_bytes:8d} bytes/frame")
+    print(f"tile: {tile_ms:6.2f} ms/frame {tile_bytes:8d} bytes/frame")
+
+    before = measure_receive(legacy_read_frames)
+    after = measure_receive(ImageReceiver()._read_frames)
+    print(f"receive before: {before:8.1f} frames/sec ({RECV_SIZE} bytes/frame)")
+    print(f"receive after : {after:8.1f} frames/sec ({RECV_SIZE} bytes/frame)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+from sgvmon.lib.trend import TrendEngine, RATE_WINDOW
+from helpers import create_history
+
+FRAMES = 3600  # 1時間分の更新（1秒ごと）
+
+
+def full_fit(timestamps, values):
+    """毎フレーム履歴から窓を探して当てはめ直す場合（比較用）"""
+    start = np.searchsorted(timestamps, timestamps[-1] - RATE_WINDOW, 'left')
+    t = (timestamps[start:] - timestamps[start]).astype(np.float64)
+    return np.polyfit(t, values[start:].astype(np.float64), 1)[0] * 60_000
+
+
+def main():
+    for weeks in (1, 2, 4, 8):
+        timestamps, values = create_history(weeks * 7 * 288)
+        engine = TrendEngine()
+        start = time.perf_counter()
+        for t, v in zip(timestamps.tolist(), values.tolist()):
+            engine.add(t, v)
+        add_us = (time.perf_counter() - start) / len(timestamps) * 1e6
+
+        start = time.perf_counter()
+        for _ in range(FRAMES):
+            engine.current()
+        frame_us = (time.perf_counter() - start) / FRAMES * 1e6
+
+        start = time.perf_counter()
+        for _ in range(FRAMES):
+            full_fit(timestamps, values)
+        refit_us = (time.perf_counter() - start) / FRAMES * 1e6
+
+        print(f"{weeks} weeks ({len(timestamps):5d} records): add {add_us:5.2f} us/record, "
+              f"frame {frame_us:5.2f} us, refit every frame {refit_us:6.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../sgvmon')))  # drawgraph 用
+
+# sgvmon.py の読み込みに必要な設定
+os.environ.setdefault('DISP_WIDTH', '480')
+os.environ.setdefault('DISP_HEIGHT', '320')
+os.environ.setdefault('FONT_PATH_SGV', 'Riety-5yaEv.otf')
+os.environ.setdefault('FONT_PATH_SYS', 'tsuchigumo.regular.otf')
+os.environ.setdefault('MONGO_PORT', '27017')
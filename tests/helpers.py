@@ -0,0 +1,80 @@
+"""テストとベンチマークで共用するフェイクと合成データ"""
+import queue
+
+import numpy as np
+from pymongo.errors import AutoReconnect, OperationFailure
+
+
+def create_history(count, spike_at=None):
+    """5分間隔の合成データ"""
+    timestamps = 1_700_000_000_000 + np.arange(count, dtype=np.int64) * 300_000
+    values = (120 + 60 * np.sin(np.arange(count) / 7)).astype(np.int16)
+    if spike_at is not None:
+        values[spike_at] = 390
+    return timestamps, values
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeStream:
+    def __init__(self, changes):
+        self.changes = changes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def try_next(self):
+        try:
+            return self.changes.get(timeout=0.05)
+        except queue.Empty:
+            return None
+
+
+class FakeEntries:
+    """MongoDB の test.entries の代わり（find と watch のみ）"""
+
+    def __init__(self, change_stream=True):
+        self.docs = []
+        self.change_stream = change_stream
+        self.changes = queue.Queue()
+        self.down = False  # True の間はサーバーに接続できない
+
+    def insert(self, date, sgv):
+        self.docs.append({'date': date, 'sgv': sgv})
+        self.changes.put({'operationType': 'insert'})
+
+    def find(self, filter=None, projection=None):
+        if self.down:
+            raise AutoReconnect('connection refused')
+        date = (filter or {}).get('date', {}).get('$gt', -1)
+        return FakeCursor([dict(doc) for doc in self.docs if doc['date'] > date])
+
+    def watch(self, pipeline=None, **kwargs):
+        if not self.change_stream:
+            raise OperationFailure('The $changeStream stage is only supported on replica sets', 40573)
+        return FakeStream(self.changes)
+
+
+class FakeClient:
+    def __init__(self, entries):
+        self.test = type('db', (), {'entries': entries})()
+
+    def close(self):
+        pass
@@ -0,0 +1,46 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sgvmon.sgvmon import DataStore
+from sgvmon.lib.trend import TrendEngine
+
+
+def test_ring_buffer_wraps():
+    store = DataStore(5)
+    store.init_records([[3000, 130], [2000, 120], [1000, 110]])
+    for i in range(4, 9):
+        assert store.add_record([i * 1000, 100 + i * 10])
+    # 古いレコードと重複は追加しない
+    assert not store.add_record([8000, 999])
+    assert not store.add_record([500, 999])
+
+    timestamps, values = store.view()
+    assert timestamps.tolist() == [4000, 5000, 6000, 7000, 8000]
+    assert values.tolist() == [140, 150, 160, 170, 180]
+    # コピーではなく内部配列のビュー
+    assert timestamps.base is store.timestamps
+    assert store.latest() == [8000, 180]
+    assert len(store) == 5
+
+
+def test_add_records_and_range():
+    store = DataStore(100)
+    # 新しい順・重複ありでまとめて届いたレコード
+    assert store.add_records([[3000, 3], [2000, 2], [3000, 3], [1000, 1]]) == 3
+    assert store.add_records([[2500, 9], [4000, 4]]) == 1
+    timestamps, values = store.range(2000, 4000)
+    assert timestamps.tolist() == [2000, 3000]
+    assert values.tolist() == [2, 3]
+    assert store.range(3500)[1].tolist() == [4]
+
+
+def test_trend_follows_appends():
+    store = DataStore(10, trend=TrendEngine())
+    store.init_records([[i * 300_000, 100 + i * 5] for i in range(5, -1, -1)])
+    assert store.trend.current().rate == 1.0
+    store.add_record([5 * 300_000, 999])  # 重複は反映しない
+    assert store.trend.current().sgv == 125
+    # 初期データを読み直すとトレンドもやり直す
+    store.init_records([[10 * 300_000, 100]])
+    assert store.trend.current() is None
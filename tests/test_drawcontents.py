@@ -0,0 +1,104 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+import sgvmon.sgvmon as sgvmon
+from sgvmon.sgvmon import DrawContents, STALE_SECONDS
+from sgvmon.lib.trend import Trend
+
+
+class FakeFramebuffer:
+    def __init__(self):
+        self.writes = []
+
+    def write_image(self, img, boxes=None):
+        self.writes.append(boxes)
+
+
+class FakeSender:
+    def __init__(self):
+        self.sent = 0
+
+    def send_image(self, img):
+        self.sent += 1
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 6, 11, 12, 0, 0)
+
+
+def create_contents():
+    fb = FakeFramebuffer()
+    sender = FakeSender()
+    contents = DrawContents(Image.new('RGB', (480, 320)), fb, sender)
+    return contents, fb, sender
+
+
+def test_same_message_is_not_redrawn():
+    contents, fb, sender = create_contents()
+    data = (np.array([0, 300_000], np.int64), np.array([100, 110], np.int16))
+    for _ in range(5):
+        contents.update(120, 110, data, STALE_SECONDS + 90)
+    # データが古い間は同じメッセージを1回だけ表示する
+    assert len(fb.writes) == 1 and sender.sent == 1
+    assert contents.frames_skipped == 4
+    # 分が変われば表示する
+    contents.update(120, 110, data, STALE_SECONDS + 150)
+    assert len(fb.writes) == 2
+
+
+def test_unchanged_frame_is_not_written(monkeypatch):
+    monkeypatch.setattr(sgvmon, 'datetime', FixedDatetime)
+    contents, fb, sender = create_contents()
+    data = (np.array([0, 300_000], np.int64), np.array([100, 110], np.int16))
+    contents.update(120, 110, data, 30)
+    assert len(fb.writes) == 1
+
+    # 同じ時刻・同じ内容で描き直しても書き込まない
+    contents.invalidate()
+    contents.update(120, 110, data, 30)
+    assert len(fb.writes) == 1 and sender.sent == 1
+    assert contents.frames_skipped == 1
+
+    # 経過時間が変われば下の行だけ書き込む
+    contents.invalidate()
+    contents.update(120, 110, data, 31)
+    assert fb.writes[-1] == [contents.status_box]
+
+
+def test_agp_view_alternates(monkeypatch):
+    from sgvmon.lib.rollup import Rollup
+    monkeypatch.setattr(sgvmon, 'datetime', FixedDatetime)
+    monkeypatch.setattr(sgvmon, 'AGP_VIEW_SECONDS', 10)
+    rollup = Rollup()
+    data = (np.array([0, 300_000], np.int64), np.array([100, 110], np.int16))
+    for timestamp, sgv in zip(*data):
+        rollup.add(timestamp, sgv)
+    contents = DrawContents(Image.new('RGB', (480, 320)), FakeFramebuffer(), FakeSender(), rollup)
+    # 12:00:00 はグラフ、12:00:10 は AGP
+    assert not contents.show_agp(FixedDatetime(2025, 6, 11, 12, 0, 0))
+    assert contents.show_agp(FixedDatetime(2025, 6, 11, 12, 0, 10))
+    contents.update(120, 110, data, 30)
+    assert contents.drawn['graph'][0] == 0
+    monkeypatch.setattr(FixedDatetime, 'now', classmethod(lambda cls, tz=None: cls(2025, 6, 11, 12, 0, 10)))
+    contents.update(120, 110, data, 40)
+    assert contents.drawn['graph'] == ('agp', rollup.version)
+
+
+def test_two_digit_sgv_layout():
+    """2桁のSGVでも差分と矢印は数字の右側に描く"""
+    def ink_columns(old_sgv, trend):
+        contents, fb, sender = create_contents()
+        contents.draw_sgv(85, old_sgv, trend)
+        img = np.asarray(contents.image)[:sgvmon.GRAPH_TOP]
+        return np.nonzero(img.any(axis=(0, 2)))[0]
+
+    digits = ink_columns(85, None)  # 数字だけ
+    marks = np.setdiff1d(ink_columns(95, Trend(0, 85, -2.5, 'SingleDown', 0, 60)), digits)
+    assert len(marks)
+    assert marks.min() > digits.max() + 5
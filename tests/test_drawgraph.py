@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+from sgvmon.drawgraph import DrawGraph, downsample_minmax
+from helpers import create_history
+
+
+def test_downsample_keeps_spikes():
+    x = np.linspace(1, 101, 5000, endpoint=False)
+    y = np.sin(np.arange(5000) / 3.0)
+    y[1234] = 10.0
+    y[4321] = -10.0
+    dx, dy = downsample_minmax(x, y)
+    assert len(dx) <= 100 * 2
+    assert dy.max() == 10.0 and dy.min() == -10.0
+    # 時間順は保たれる
+    assert np.all(np.diff(dx) >= 0)
+
+
+def test_long_history_graph():
+    timestamps, values = create_history(14 * 288, spike_at=2000)
+    img = DrawGraph(480, 140, (0, 0, 0)).create_graph(timestamps, values)
+    green = np.asarray(img)[..., 1]
+    # スパイクの頂点（グラフの最上部）まで描かれている
+    assert green[:3].any()
+
+
+def test_forecast_is_drawn_after_data():
+    timestamps, values = create_history(50)
+    graph = DrawGraph(480, 140, (0, 0, 0))
+    last = (int(timestamps[-1]), int(values[-1]))
+    img = np.asarray(graph.create_graph(timestamps, values)).copy()
+    assert img[:, -3:, 1].any()  # 予測線がなければデータが右端まで
+    forecast = (last, (last[0] + 1_800_000, 60))
+    img = np.asarray(graph.create_graph(timestamps, values, forecast))
+    # 横軸が予測の終点まで伸び、右端には予測線の点だけがある
+    right = img[:, -40:]
+    assert (right[..., 1] == graph.forecast_color[1]).any()
+    assert not (right[..., 1] == 128).any()  # データの線（green）は届かない
+
+
+def test_unchanged_data_is_not_redrawn():
+    timestamps, values = create_history(50)
+    graph = DrawGraph(480, 140, (0, 0, 0))
+    img = graph.create_graph(timestamps, values)
+    img.putpixel((0, 0), (1, 2, 3))  # 描き直されたかの目印
+    assert graph.create_graph(timestamps.copy(), values.copy()) is img
+    assert img.getpixel((0, 0)) == (1, 2, 3)
+    values[-1] += 10
+    graph.create_graph(timestamps, values)
+    assert img.getpixel((0, 0)) != (1, 2, 3)
+
+
+def test_background_layer_lru():
+    graph = DrawGraph(480, 140, (0, 0, 0))
+    first = graph.background(40, 200, 160)
+    assert graph.background(40, 200, 160) is first
+    for i in range(1, graph.max_layers):
+        graph.background(40, 200 + i, 160 + i)
+    graph.background(40, 200, 160)  # 最近使ったものは残る
+    graph.background(40, 300, 260)
+    assert len(graph.layers) == graph.max_layers
+    assert (40, 200, 160) in graph.layers
+    assert (40, 201, 161) not in graph.layers  # 最も古いものを捨てる
+    assert graph.background(40, 200, 160) is first
@@ -0,0 +1,112 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+from PIL import Image
+from sgvmon.lib.fb import Framebuffer, layout_from_bitfields
+
+WIDTH = 48
+HEIGHT = 32
+
+
+def create_fake_device(path, size):
+    """ファイルで /dev/fb0 の代わりを作る"""
+    with open(path, 'wb') as f:
+        f.truncate(size)
+    return str(path)
+
+
+def create_test_image():
+    img = Image.new('RGB', (WIDTH, HEIGHT), (0, 0, 0))
+    img.paste((255, 0, 0), (0, 0, 10, 10))
+    img.paste((16, 132, 255), (10, 10, 20, 20))
+    return img
+
+
+def test_bgra(tmp_path):
+    device = create_fake_device(tmp_path / 'fb0', WIDTH * HEIGHT * 4)
+    fb = Framebuffer(WIDTH, HEIGHT, device=device)
+    fb.open()
+    fb.write_image(create_test_image())
+    data = np.frombuffer(fb.fb, np.uint8).reshape(HEIGHT, WIDTH, 4)
+    assert fb.layout == 'BGRA'
+    assert tuple(data[0, 0]) == (0, 0, 255, 255)
+    assert tuple(data[15, 15]) == (255, 132, 16, 255)
+    del data
+    fb.close()
+
+
+def test_rgb565_with_stride(tmp_path):
+    # 横幅より長いラインストライドを持つ16bpp パネル
+    line_length = WIDTH * 2 + 64
+    device = create_fake_device(tmp_path / 'fb1', line_length * HEIGHT)
+    fb = Framebuffer(WIDTH, HEIGHT, device=device, bits_per_pixel=16,
+                     line_length=line_length)
+    fb.open()
+    fb.write_image(create_test_image())
+    rows = np.frombuffer(fb.fb, '<u2').reshape(HEIGHT, line_length // 2)
+    assert fb.layout == 'RGB565'
+    assert rows[0, 0] == 0xF800
+    assert rows[15, 15] == (16 >> 3) << 11 | (132 >> 2) << 5 | (255 >> 3)
+    # ストライドの余白には書き込まない
+    assert not rows[:, WIDTH:].any()
+    del rows
+    fb.close()
+
+
+def test_sysfs_detection(tmp_path):
+    sysfs = tmp_path / 'graphics' / 'fb9'
+    sysfs.mkdir(parents=True)
+    (sysfs / 'virtual_size').write_text(f'{WIDTH},{HEIGHT * 2}\n')
+    (sysfs / 'bits_per_pixel').write_text('16\n')
+    (sysfs / 'stride').write_text(f'{WIDTH * 2}\n')
+    device = create_fake_device(tmp_path / 'fb9', WIDTH * HEIGHT * 4)
+    fb = Framebuffer(WIDTH, HEIGHT, device=device)
+    fb.SYSFS_DIR = str(tmp_path / 'graphics')
+    # 通常ファイルは名前が一致してもコンストラクタの値を使う
+    fb.open()
+    assert (fb.bits_per_pixel, fb.line_length, fb.layout) == (32, WIDTH * 4, 'BGRA')
+    fb.close()
+    # デバイスの場合に使う sysfs の読み取り
+    assert fb._detect_sysfs() == 'RGB565'
+    assert (fb.width, fb.bits_per_pixel, fb.line_length) == (WIDTH, 16, WIDTH * 2)
+
+
+def test_layout_from_bitfields():
+    assert layout_from_bitfields(32, (16, 8), (8, 8), (0, 8), (0, 0)) == 'BGRX'
+    assert layout_from_bitfields(32, (16, 8), (8, 8), (0, 8), (24, 8)) == 'BGRA'
+    assert layout_from_bitfields(32, (0, 8), (8, 8), (16, 8), (24, 8)) == 'RGBA'
+    assert layout_from_bitfields(16, (11, 5), (5, 6), (0, 5), (0, 0)) == 'RGB565'
+
+
+def test_partial_update(tmp_path):
+    device = create_fake_device(tmp_path / 'fb2', WIDTH * HEIGHT * 4)
+    fb = Framebuffer(WIDTH, HEIGHT, device=device)
+    fb.open()
+    img = create_test_image()
+    fb.write_image(img)
+
+    # 変更した領域を含む行だけが書き換わる
+    img.paste((0, 255, 0), (0, 0, WIDTH, HEIGHT))
+    fb.write_image(img, [(30, 24, 40, 28), (0, 26, 5, 30)])
+    data = np.frombuffer(fb.fb, np.uint8).reshape(HEIGHT, WIDTH, 4)
+    assert tuple(data[24, 0]) == (0, 255, 0, 255)
+    assert tuple(data[29, 47]) == (0, 255, 0, 255)
+    assert tuple(data[23, 47]) == (0, 0, 0, 255)
+    assert tuple(data[30, 0]) == (0, 0, 0, 255)
+    del data
+    fb.close()
+
+
+def test_snapshot_restore(tmp_path):
+    # 起動画面キャッシュ用：内容をそのまま保存して書き戻せる
+    device = create_fake_device(tmp_path / 'fb0', WIDTH * HEIGHT * 4)
+    fb = Framebuffer(WIDTH, HEIGHT, device=device)
+    fb.open()
+    fb.write_image(create_test_image())
+    data = fb.snapshot()
+    fb.write_image(Image.new('RGB', (WIDTH, HEIGHT), (0, 0, 0)))
+    assert fb.restore(data)
+    assert fb.snapshot() == data
+    assert not fb.restore(data[:-1])
+    fb.close()
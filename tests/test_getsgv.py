@@ -0,0 +1,101 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import time
+
+from sgvmon.sgvmon import (DataStore, GetSGV, SGVWatcher, CGM_INTERVAL, MIN_POLL_INTERVAL, MAX_POLL_INTERVAL,
+                           MIN_RETRY_INTERVAL, MAX_RETRY_INTERVAL)
+from helpers import FakeEntries, FakeClient
+
+
+def create_get_sgv(entries):
+    return GetSGV(FakeClient(entries))
+
+
+def run_watcher(entries, get_sgv):
+    entries.insert(1000, 100)
+    watcher = SGVWatcher(get_sgv, 1000)
+    watcher.start()
+    time.sleep(0.2)
+    entries.insert(2000, 110)
+    entries.insert(3000, 120)
+    assert watcher.wait(2)
+    records = []
+    deadline = time.time() + 2
+    while len(records) < 2 and time.time() < deadline:
+        watcher.wait(0.1)
+        records += watcher.take_records()
+    watcher.stop()
+    return watcher, sorted(records, reverse=True)
+
+
+def test_push_mode():
+    entries = FakeEntries(change_stream=True)
+    watcher, records = run_watcher(entries, create_get_sgv(entries))
+    assert watcher.mode == 'push'
+    assert records == [[3000, 120], [2000, 110]]
+
+
+def test_poll_fallback():
+    entries = FakeEntries(change_stream=False)
+    get_sgv = create_get_sgv(entries)
+    get_sgv.poll_interval = lambda last_date, now: 0.05
+    watcher, records = run_watcher(entries, get_sgv)
+    assert watcher.mode == 'poll'
+    assert records == [[3000, 120], [2000, 110]]
+
+
+def test_poll_interval():
+    now = 1_000_000.0
+    last = now * 1000
+    # 次の測定予定までは問い合わせない（上限あり）
+    assert GetSGV.poll_interval(last, now) == MAX_POLL_INTERVAL
+    assert GetSGV.poll_interval(last, now + CGM_INTERVAL) > MIN_POLL_INTERVAL
+    # 予定を過ぎたら短い間隔で、遅れが続くほど間隔を延ばす
+    assert GetSGV.poll_interval(last, now + CGM_INTERVAL + 60) == MIN_POLL_INTERVAL
+    assert GetSGV.poll_interval(last, now + CGM_INTERVAL * 3) > MIN_POLL_INTERVAL
+    assert GetSGV.poll_interval(last, now + CGM_INTERVAL * 100) == MAX_POLL_INTERVAL
+
+
+def test_fetch_since_and_add_records():
+    entries = FakeEntries()
+    get_sgv = create_get_sgv(entries)
+    store = DataStore(10)
+    for i in range(1, 4):
+        entries.insert(i * 1000, 100 + i)
+    records = get_sgv.fetch_since(0)
+    assert records == [[3000, 103], [2000, 102], [1000, 101]]  # 新しい順
+    assert store.add_records(records) == 3
+
+    # 欠測後にまとめて届いた分は、最新より新しいものだけを取得する
+    entries.insert(5000, 105)
+    entries.insert(4000, 104)
+    records = get_sgv.fetch_since(store.latest()[0])
+    assert records == [[5000, 105], [4000, 104]]
+    assert store.add_records(records + [[3000, 103]]) == 2  # 重複は加えない
+    timestamps, values = store.view()
+    assert timestamps.tolist() == [1000, 2000, 3000, 4000, 5000]
+    assert values.tolist() == [101, 102, 103, 104, 105]
+    assert get_sgv.fetch_since(5000) == []
+    assert get_sgv.stats()['fetches'] == 3
+
+
+def test_retry_backoff():
+    entries = FakeEntries()
+    get_sgv = create_get_sgv(entries)
+    entries.insert(1000, 100)
+    entries.down = True
+    # 失敗しても例外にせず、失敗が続くほど再試行の間隔を延ばす
+    intervals = []
+    for _ in range(8):
+        assert get_sgv.fetch_since(0) == []
+        intervals.append(get_sgv.retry_interval())
+    assert intervals[:3] == [MIN_RETRY_INTERVAL, MIN_RETRY_INTERVAL * 2, MIN_RETRY_INTERVAL * 4]
+    assert intervals[-1] == MAX_RETRY_INTERVAL
+    assert get_sgv.stats()['failures'] == 8
+
+    # 成功したら元に戻る
+    entries.down = False
+    assert get_sgv.fetch_since(0) == [[1000, 100]]
+    assert get_sgv.retry_interval() == 0
+    assert get_sgv.stats()['consecutive_failures'] == 0
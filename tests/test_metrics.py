@@ -0,0 +1,57 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import urllib.request
+
+from sgvmon.lib.metrics import Metrics, MetricsServer
+
+
+def test_summary():
+    metrics = Metrics(window=100)
+    for ms in range(1, 101):
+        metrics.observe("graph", ms / 1000)
+    s = metrics.summary()["graph"]
+    assert s["count"] == 100
+    assert abs(s["p50"] - 0.051) < 1e-9
+    assert abs(s["p95"] - 0.096) < 1e-9
+    assert abs(s["max"] - 0.100) < 1e-9
+
+    # 直近 window 回分だけで集計する（count と sum は累計）
+    for _ in range(100):
+        metrics.observe("graph", 0.001)
+    s = metrics.summary()["graph"]
+    assert s["count"] == 200
+    assert s["max"] == 0.001
+    assert abs(s["lifetime_max"] - 0.100) < 1e-9  # 起動からの最大は残る
+
+
+def test_stage():
+    metrics = Metrics()
+    try:
+        with metrics.stage("fetch"):
+            raise ValueError
+    except ValueError:
+        pass
+    # 例外で抜けた場合も記録する
+    assert metrics.summary()["fetch"]["count"] == 1
+    assert "fetch=p50:" in metrics.format_summary()
+
+
+def test_prometheus_endpoint():
+    metrics = Metrics()
+    metrics.observe("fb_write", 0.002)
+    metrics.count("mongo_error")
+    metrics.count("mongo_error")
+    server = MetricsServer(metrics, port=0)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=2) as res:
+            body = res.read().decode()
+    finally:
+        server.stop()
+    assert "# TYPE sgvmon_stage_seconds summary" in body
+    assert 'sgvmon_stage_seconds{stage="fb_write",quantile="0.5"} 0.002000' in body
+    assert 'sgvmon_stage_seconds_count{stage="fb_write"} 1' in body
+    assert 'sgvmon_stage_seconds_max{stage="fb_write"} 0.002000' in body
+    assert 'sgvmon_stage_seconds_lifetime_max{stage="fb_write"} 0.002000' in body
+    assert 'sgvmon_events_total{event="mongo_error"} 2' in body
@@ -0,0 +1,130 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import gzip
+import hashlib
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sgvmon.sgvmon import NightscoutSGV, NightscoutClient, NightscoutError
+
+API_SECRET = 'secret-for-test'
+
+
+class StubNightscout:
+    """/api/v1/entries/sgv.json だけを返す Nightscout の代わり"""
+
+    def __init__(self):
+        self.entries = []  # 新しい順
+        self.requests = []  # (クエリ, ヘッダー, ステータス)
+        self.ports = set()  # 接続してきたクライアントのポート
+        self.drop = False  # True なら応答後に（通知せずに）接続を閉じる
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def do_GET(self):
+                self.drop = stub.drop
+                stub.ports.add(self.client_address[1])
+                url = urllib.parse.urlsplit(self.path)
+                query = dict(urllib.parse.parse_qsl(url.query))
+                if self.headers.get('api-secret') != hashlib.sha1(API_SECRET.encode()).hexdigest():
+                    return self.reply(query, 401, b'Unauthorized')
+                if url.path != '/api/v1/entries/sgv.json':
+                    return self.reply(query, 404, b'Not Found')
+                entries = stub.entries
+                if 'find[date][$gt]' in query:
+                    entries = [e for e in entries if e['date'] > int(query['find[date][$gt]'])]
+                body = json.dumps(entries[:int(query.get('count', 10))]).encode()
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    return self.reply(query, 304, b'', {'ETag': etag})
+                headers = {'ETag': etag, 'Content-Type': 'application/json'}
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body)
+                    headers['Content-Encoding'] = 'gzip'
+                self.reply(query, 200, body, headers)
+
+            def reply(self, query, status, body, headers=None):
+                stub.requests.append((query, dict(self.headers), status))
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                if self.drop:
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def add(self, date, sgv):
+        self.entries.insert(0, {'date': date, 'sgv': sgv, 'type': 'sgv'})
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stub():
+    stub = StubNightscout()
+    yield stub
+    stub.close()
+
+
+def test_incremental_and_conditional(stub):
+    stub.add(1000, 100)
+    stub.add(2000, 110)
+    source = NightscoutSGV(NightscoutClient(stub.url, api_secret=API_SECRET))
+    assert source.init_sgv_docs(50) == [[2000, 110], [1000, 100]]
+
+    # 前回より新しいものだけを問い合わせる
+    assert source.fetch_since(2000) == []
+    assert stub.requests[-1][0]['find[date][$gt]'] == '2000'
+    # 同じ問い合わせで変化がなければ 304（本文なし）
+    assert source.fetch_since(2000) == []
+    assert stub.requests[-1][2] == 304
+    assert source.client.stats()['not_modified'] == 1
+
+    stub.add(3000, 120)
+    assert source.fetch_since(2000) == [[3000, 120]]
+    assert stub.requests[-1][2] == 200
+    assert stub.requests[-1][1]['Accept-Encoding'] == 'gzip'
+
+    # すべて1本の接続で行う
+    assert len(stub.ports) == 1
+    assert source.client.stats()['connections'] == 1
+    source.close()
+
+
+def test_reconnect_after_server_close(stub):
+    stub.add(1000, 100)
+    client = NightscoutClient(stub.url, api_secret=API_SECRET)
+    assert client.entries_since(None, 10) == stub.entries
+    # サーバー側で keep-alive の接続が閉じられても繋ぎ直して取得する
+    stub.drop = True
+    assert client.entries_since(None, 10) == stub.entries
+    stub.drop = False
+    assert client.entries_since(None, 10) == stub.entries
+    assert client.stats()['connections'] == 2
+    assert len(stub.ports) == 2
+    client.close()
+
+
+def test_errors_are_counted(stub):
+    source = NightscoutSGV(NightscoutClient(stub.url, api_secret='wrong'))
+    assert source.fetch_since(0) == []
+    assert source.stats()['failures'] == 1
+    with pytest.raises(NightscoutError):
+        source.init_sgv_docs(50)
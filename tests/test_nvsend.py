@@ -2,9 +2,15 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import threading
+import io
+import selectors
+import socket
+import struct
 import time
-from PIL import Image
-from sgvmon.lib.nvsend import ImageSender, ImageReceiver
+import pytest
+from PIL import Image, ImageDraw
+from sgvmon.lib.nvsend import ImageSender, ImageReceiver, BackgroundSender, TileEncoder, FrameDecoder, ImagePublisher
+from sgvmon.lib.nvsend import WebStreamServer, DELTA_RECT, _WebClient
 
 HOST = '127.0.0.1'
 PORT = 49011
@@ -27,6 +33,385 @@ def receiver_thread():
     receiver.save_png(data, 'received_test.png')
     print('受信・保存完了')
 
+def test_persistent_stream():
+    """1本の接続で複数フレームを送受信する"""
+    port = PORT + 1
+    received = []
+
+    def receive():
+        receiver = ImageReceiver(host=HOST, port=port)
+        for data in receiver.receive_frames():
+            received.append(bytes(data))  # data は次のフレームで上書きされる
+            if len(received) == 3:
+                return
+
+    t_recv = threading.Thread(target=receive, daemon=True)
+    t_recv.start()
+    time.sleep(0.5)  # サーバ起動待ち
+    sender = ImageSender(host=HOST, port=port, persistent=True)
+    for _ in range(3):
+        sender.send_image(create_test_image())
+    sock = sender.sock
+    t_recv.join(5)
+    sender.close()
+    assert sock is not None
+    assert len(received) == 3
+    assert all(data.startswith(b'\x89PNG') for data in received)
+
+def test_background_sender_drops_stale_frames():
+    """送信が遅い場合は古いフレームを捨て、呼び出し側は待たされない"""
+    class SlowSender:
+        host = HOST
+        def __init__(self):
+            self.sent = []
+        def send_image(self, img):
+            time.sleep(0.2)
+            self.sent.append(img.getpixel((0, 0)))
+            return True
+        def close(self):
+            pass
+
+    slow = SlowSender()
+    sender = BackgroundSender(slow)
+    sender.start()
+    start = time.perf_counter()
+    for i in range(5):
+        sender.send_image(Image.new('RGB', (10, 10), (i, 0, 0)))
+        time.sleep(0.01)
+    assert time.perf_counter() - start < 0.2
+    sender.stop()
+    stats = sender.stats()
+    assert slow.sent[-1] == (4, 0, 0)
+    assert stats['sent'] == len(slow.sent)
+    assert stats['sent'] + stats['dropped'] == 5
+
+
+def test_background_sender_survives_errors():
+    """送信先が例外を出しても送信スレッドは止まらず、他の送信先にも送る"""
+    class BrokenSender:
+        host = HOST
+        def send_image(self, img):
+            raise RuntimeError("broken")
+        def close(self):
+            pass
+
+    class RecordingSender(BrokenSender):
+        def __init__(self):
+            self.sent = 0
+        def send_image(self, img):
+            self.sent += 1
+            return True
+
+    recording = RecordingSender()
+    sender = BackgroundSender(BrokenSender(), recording)
+    sender.start()
+    for i in range(3):
+        sender.send_image(Image.new('RGB', (10, 10), (i, 0, 0)))
+        deadline = time.time() + 5
+        while recording.sent <= i and time.time() < deadline:
+            time.sleep(0.01)
+    sender.stop()
+    assert recording.sent == 3
+    assert sender.stats()['failed'] == 3
+
+
+def test_background_sender_isolates_targets():
+    """遅い送信先があっても、他の送信先には遅れずに送る"""
+    class SlowSender:
+        host = HOST
+        def __init__(self, delay):
+            self.delay = delay
+            self.sent = []
+        def send_image(self, img):
+            time.sleep(self.delay)
+            self.sent.append(img.getpixel((0, 0)))
+            return True
+        def close(self):
+            pass
+
+    slow, fast = SlowSender(1.0), SlowSender(0)
+    sender = BackgroundSender(slow, fast)
+    sender.start()
+    for i in range(5):
+        sender.send_image(Image.new('RGB', (10, 10), (i, 0, 0)))
+        time.sleep(0.05)
+    deadline = time.time() + 0.5
+    while len(fast.sent) < 5 and time.time() < deadline:
+        time.sleep(0.01)
+    assert fast.sent == [(i, 0, 0) for i in range(5)]
+    assert slow.sent == []  # 1枚目を送っている途中
+    sender.stop()
+    assert slow.sent == [(0, 0, 0), (4, 0, 0)]
+    stats = sender.stats()
+    assert [t['sent'] for t in stats['targets']] == [2, 5]
+    assert stats['targets'][0]['dropped'] == 3
+    assert stats['sent'] == 7
+
+
+def test_tile_roundtrip():
+    """タイル差分形式でエンコードした画像が元通りに復元される"""
+    encoder = TileEncoder(tile_size=16, keyframe_interval=3)
+    decoder = FrameDecoder()
+    img = Image.new('RGB', (100, 70), (0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    sizes = []
+    for i in range(6):
+        draw.rectangle((i * 10, 60, i * 10 + 5, 69), fill=(255, i * 40, 0))
+        out = io.BytesIO()
+        encoder.encode(img, out)
+        sizes.append(len(out.getvalue()))
+        assert decoder.decode(out.getvalue()).tobytes() == img.tobytes()
+    # 差分フレームはキーフレームより小さい
+    assert sizes[1] < sizes[0] and sizes[4] < sizes[3]
+
+class ChunkedConn:
+    """recv_into のたびに決まった長さずつ返すソケットの代わり"""
+    def __init__(self, data, chunk):
+        self.data = data
+        self.chunk = chunk
+        self.calls = 0
+
+    def recv_into(self, view):
+        self.calls += 1
+        n = min(len(view), self.chunk, len(self.data))
+        view[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+def test_frames_split_across_recv():
+    """フレームが何回かに分かれて届いても、受信バッファを使い回して復元する"""
+    frames = [b'x' * 10, b'', b'y' * 3, b'z' * 25]
+    data = b''.join(struct.pack('!I', len(f)) + f for f in frames)
+    conn = ChunkedConn(data, 3)
+    receiver = ImageReceiver()
+    assert [bytes(view) for view in receiver._read_frames(conn)] == frames
+    assert conn.calls > len(frames) * 2
+    assert receiver.frames_received == 4 and receiver.bytes_received == len(data)
+
+
+def test_connection_closed_mid_frame():
+    """フレームの途中で接続が切れたら RuntimeError にする（フレームの区切りなら正常に終わる）"""
+    frame = struct.pack('!I', 10) + b'x' * 10
+    for partial in (frame + struct.pack('!I', 10)[:2], frame + struct.pack('!I', 10) + b'y' * 4):
+        frames = ImageReceiver()._read_frames(ChunkedConn(partial, 4))
+        assert bytes(next(frames)) == b'x' * 10
+        with pytest.raises(RuntimeError):
+            next(frames)
+
+    port = PORT + 7
+    errors = []
+
+    def receive():
+        try:
+            ImageReceiver(host=HOST, port=port).receive_image_data()
+        except RuntimeError as e:
+            errors.append(e)
+
+    t_recv = threading.Thread(target=receive, daemon=True)
+    t_recv.start()
+    time.sleep(0.5)  # サーバ起動待ち
+    with socket.create_connection((HOST, port)) as sock:
+        sock.sendall(struct.pack('!I', 100) + b'x' * 50)
+    t_recv.join(5)
+    assert len(errors) == 1
+
+
+def test_publisher_fanout():
+    """1回エンコードしたフレームを複数のビューアへ配信する"""
+    port = PORT + 2
+    publisher = ImagePublisher(host=HOST, port=port, encoding='tile')
+    publisher.start()
+    viewers = [ImageReceiver(host=HOST, port=port) for _ in range(2)]
+    streams = [viewer.receive_images(viewer.subscribe_frames()) for viewer in viewers]
+    received = [[], []]
+
+    def receive(idx):
+        for img in streams[idx]:
+            received[idx].append(img.getpixel((0, 0)))
+            if received[idx][-1] == (3, 0, 0):
+                return
+
+    threads = [threading.Thread(target=receive, args=(i,), daemon=True) for i in range(2)]
+    for t in threads:
+        t.start()
+    while len(publisher.stats()['subscribers']) < 2:
+        time.sleep(0.01)
+    for i in range(4):
+        publisher.send_image(Image.new('RGB', (64, 48), (i, 0, 0)))
+        time.sleep(0.05)
+    for t in threads:
+        t.join(5)
+    publisher.close()
+    assert received[0][-1] == received[1][-1] == (3, 0, 0)
+    assert publisher.stats()['published'] == 4
+    # 停止後は送信スレッドの中で待ち受けを始め直さない
+    assert publisher.send_image(Image.new('RGB', (64, 48))) is False
+    assert not publisher.running
+
+
+def test_publisher_skips_encoding_without_subscribers():
+    """ビューアがいない間はエンコードせず、接続したビューアには最新の画像全体を送る"""
+    port = PORT + 6
+    publisher = ImagePublisher(host=HOST, port=port, encoding='tile')
+    encoded = []
+    encode = publisher.encoder.encode
+    publisher.encoder.encode = lambda img, out: (encoded.append(img), encode(img, out))
+    publisher.start()
+    try:
+        publisher.send_image(Image.new('RGB', (64, 48), (1, 0, 0)))
+        publisher.send_image(Image.new('RGB', (64, 48), (2, 0, 0)))
+        assert encoded == []
+        assert publisher.stats()['published'] == 2
+
+        viewer = ImageReceiver(host=HOST, port=port)
+        stream = viewer.receive_images(viewer.subscribe_frames())
+        assert next(stream).getpixel((0, 0)) == (2, 0, 0)
+        publisher.send_image(Image.new('RGB', (64, 48), (3, 0, 0)))
+        img = next(stream)
+        assert img.getpixel((0, 0)) == img.getpixel((63, 47)) == (3, 0, 0)
+        assert len(encoded) == 1
+    finally:
+        publisher.close()
+
+
+def read_headers(stream):
+    """HTTP の応答ヘッダを読み、ステータス行を返す"""
+    status = stream.readline()
+    while stream.readline().strip():
+        pass
+    return status
+
+
+def read_mjpeg_part(stream):
+    """MJPEG のパートを1つ読み、画像を返す"""
+    length = None
+    while True:
+        line = stream.readline().strip()
+        if line.startswith(b'Content-Length:'):
+            length = int(line.split(b':')[1])
+        elif not line and length is not None:
+            break
+    img = Image.open(io.BytesIO(stream.read(length)))
+    stream.readline()
+    return img
+
+
+def read_ws_message(stream):
+    """WebSocket のメッセージを1つ読み、[(x, y, 画像), ...] を返す"""
+    size = stream.read(2)[1]
+    if size == 126:
+        size = struct.unpack('!H', stream.read(2))[0]
+    elif size == 127:
+        size = struct.unpack('!Q', stream.read(8))[0]
+    payload = stream.read(size)
+    count = struct.unpack_from('!H', payload)[0]
+    offset = 2 + count * DELTA_RECT.size
+    rects = []
+    for i in range(count):
+        x, y, w, h, length = DELTA_RECT.unpack_from(payload, 2 + i * DELTA_RECT.size)
+        rects.append((x, y, Image.open(io.BytesIO(payload[offset:offset + length]))))
+        offset += length
+    return rects
+
+
+def test_web_stream_mjpeg():
+    """MJPEG は見ている人がいる時だけ、1フレームにつき1回だけエンコードする"""
+    port = PORT + 3
+    server = WebStreamServer(host=HOST, port=port)
+    server.start()
+    server.send_image(Image.new('RGB', (64, 48), (255, 0, 0)))
+    assert server.stats()['encoded'] == 0  # 見ている人がいなければエンコードしない
+
+    socks = [socket.create_connection((HOST, port), timeout=5) for _ in range(2)]
+    streams = [sock.makefile('rb') for sock in socks]
+    for sock, stream in zip(socks, streams):
+        sock.sendall(b'GET /stream.mjpg HTTP/1.1\r\nHost: test\r\n\r\n')
+        assert b'200' in read_headers(stream)
+        assert read_mjpeg_part(stream).getpixel((0, 0))[0] > 200
+    server.send_image(Image.new('RGB', (64, 48), (0, 0, 255)))
+    for stream in streams:
+        assert read_mjpeg_part(stream).getpixel((0, 0))[2] > 200
+    assert server.stats()['encoded'] == 2  # 2人に送っても1フレーム1回
+
+    # 最新の1枚
+    with socket.create_connection((HOST, port), timeout=5) as sock:
+        sock.sendall(b'GET /frame.jpg HTTP/1.1\r\nHost: test\r\n\r\n')
+        data = sock.makefile('rb').read()
+    assert Image.open(io.BytesIO(data.split(b'\r\n\r\n', 1)[1])).size == (64, 48)
+    for sock in socks:
+        sock.close()
+    server.close()
+
+
+def test_web_stream_websocket_delta():
+    """WebSocket は最初に画面全体、その後は変化した矩形だけを送る"""
+    port = PORT + 4
+    server = WebStreamServer(host=HOST, port=port)
+    server.start()
+    img = Image.new('RGB', (120, 80), (0, 0, 0))
+    server.send_image(img.copy())
+
+    sock = socket.create_connection((HOST, port), timeout=5)
+    stream = sock.makefile('rb')
+    sock.sendall(b'GET /ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\n'
+                 b'Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                 b'Sec-WebSocket-Version: 13\r\n\r\n')
+    status = stream.readline()
+    accept = None
+    while line := stream.readline().strip():
+        if line.startswith(b'Sec-WebSocket-Accept:'):
+            accept = line.split(b':', 1)[1].strip()
+    assert b'101' in status and accept == b's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+    view = Image.new('RGB', (120, 80))
+    for x, y, part in read_ws_message(stream):
+        view.paste(part, (x, y))
+    assert view.tobytes() == img.tobytes()
+
+    # 離れた2か所を変えると2つの矩形で届く
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((10, 5, 19, 9), fill=(255, 255, 255))
+    draw.rectangle((100, 70, 109, 74), fill=(0, 255, 0))
+    server.send_image(img.copy())
+    rects = read_ws_message(stream)
+    assert [(x, y, part.size) for x, y, part in rects] == [(10, 5, (10, 5)), (100, 70, (10, 5))]
+    for x, y, part in rects:
+        view.paste(part, (x, y))
+    assert view.tobytes() == img.tobytes()
+
+    # 同じ画面なら何も送らない
+    server.send_image(img.copy())
+    time.sleep(0.1)
+    assert server.stats()['subscribers'][0]['sent'] == 2
+    sock.close()
+    server.close()
+
+
+def test_web_stream_header_is_not_replaced():
+    """応答ヘッダを送る前に次のフレームが来ても、ヘッダは置き換えられない"""
+    server = WebStreamServer(host=HOST, port=PORT + 5)
+    server.start()
+    server.send_image(Image.new('RGB', (64, 48), (255, 0, 0)))
+    for request, status in ((b'GET /stream.mjpg HTTP/1.1\r\n\r\n', b'HTTP/1.1 200'),
+                            (b'GET /ws HTTP/1.1\r\nUpgrade: websocket\r\n'
+                             b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n', b'HTTP/1.1 101')):
+        sock, peer = socket.socketpair()
+        sock.setblocking(False)
+        peer.settimeout(5)
+        sub = _WebClient(sock, 'test')
+        sub.request = bytearray(request)
+        with server.lock:
+            server.subscribers[sock.fileno()] = sub
+        server.selector.register(sock, selectors.EVENT_READ, sub)
+        server._handle_request(sub)
+        # 応答ヘッダを送る前に次のフレームが届いた場合
+        server.send_image(Image.new('RGB', (64, 48), (0, 0, 255)))
+        server._wake()  # 通常は受信した配信スレッドがそのまま送る
+        assert peer.recv(len(status), socket.MSG_WAITALL) == status
+        peer.close()
+    server.close()
+
 if __name__ == '__main__':
     # 受信側スレッド
     t_recv = threading.Thread(target=receiver_thread)
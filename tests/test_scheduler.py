@@ -0,0 +1,31 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import threading
+import time
+from sgvmon.lib.scheduler import Scheduler
+
+
+def test_timers_in_order():
+    scheduler = Scheduler()
+    now = time.time()
+    scheduler.schedule(now + 0.10, 'b')
+    scheduler.schedule(now + 0.05, 'a')
+    assert scheduler.wait() == ['a']
+    assert time.time() - (now + 0.05) < 0.02
+    assert scheduler.wait() == ['b']
+    # タイマーがなければタイムアウトで戻る
+    assert scheduler.wait(0.01) == []
+
+
+def test_notify_and_reschedule():
+    scheduler = Scheduler()
+    scheduler.schedule(time.time() + 10, 'draw')
+    scheduler.reschedule(time.time() + 20, 'draw')
+    assert len(scheduler.timers) == 1
+    threading.Timer(0.05, scheduler.notify).start()
+    start = time.time()
+    assert scheduler.wait() == [Scheduler.NOTIFY]
+    assert time.time() - start < 1
+    scheduler.cancel('draw')
+    assert scheduler.next_time('draw') is None
@@ -0,0 +1,62 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sgvmon.lib.sgvcache import SGVCache, MAGIC, RECORD
+from sgvmon.sgvmon import DataStore
+
+
+def test_append_and_reload(tmp_path):
+    path = str(tmp_path / 'cache' / 'sgv.bin')
+    cache = SGVCache(path, 100)
+    cache.open()
+    assert cache.append([1000, 2000, 3000], [110, 120, 130]) == 3
+    # 保存済みより古いレコードは追記しない
+    assert cache.append([2000, 4000], [999, 140]) == 1
+    cache.close()
+
+    cache = SGVCache(path, 100)
+    cache.open()
+    assert cache.last_date == 4000
+    timestamps, values = cache.load(2)
+    assert timestamps.tolist() == [3000, 4000]
+    assert values.tolist() == [130, 140]
+    cache.close()
+
+
+def test_truncated_record_and_compaction(tmp_path):
+    path = str(tmp_path / 'sgv.bin')
+    cache = SGVCache(path, 10, compact_factor=2)
+    cache.open()
+    cache.append(list(range(1, 26)), list(range(101, 126)))
+    cache.close()
+    # 書き込み途中で止まった半端なレコード
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    cache = SGVCache(path, 10, compact_factor=2)
+    cache.open()
+    assert cache.count == 10
+    assert os.path.getsize(path) == len(MAGIC) + 10 * RECORD.itemsize
+    assert cache.load(100)[0].tolist() == list(range(16, 26))
+    cache.close()
+
+
+def test_datastore_write_through(tmp_path):
+    path = str(tmp_path / 'sgv.bin')
+    cache = SGVCache(path, 5)
+    cache.open()
+    store = DataStore(5, cache)
+    store.init_records([[2000, 120], [1000, 110]])
+    store.add_records([[4000, 140], [3000, 130], [2000, 120]])
+    store.add_record([5000, 150])
+    cache.close()
+
+    # 次回の起動ではファイルから同じ内容を復元する
+    cache = SGVCache(path, 5)
+    cache.open()
+    restored = DataStore(5, cache)
+    assert restored.load_cache() == 5
+    assert restored.view()[0].tolist() == [1000, 2000, 3000, 4000, 5000]
+    assert restored.latest() == [5000, 150]
+    cache.close()
@@ -0,0 +1,44 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from PIL import Image, ImageDraw, ImageFont
+from sgvmon.textcache import TextCache
+
+FONT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../fonts'))
+
+
+def test_same_as_draw_text():
+    """キャッシュした文字で描いた結果が ImageDraw.text と一致する"""
+    cache = TextCache()
+    for name, size, text in (('tsuchigumo.regular.otf', 24, '2025-06-11 Wed 12:34:56'),
+                             ('Riety-5yaEv.otf', 200, '123'),
+                             ('Riety-5yaEv.otf', 72, '+12')):
+        font = ImageFont.truetype(os.path.join(FONT_DIR, name), size)
+        expected = Image.new('RGB', (480, 320), (0, 0, 200))
+        draw = ImageDraw.Draw(expected)
+        draw.text((10, 20), text, fill=(200, 200, 200), font=font)
+        actual = Image.new('RGB', (480, 320), (0, 0, 200))
+        cache.draw_text(actual, (10, 20), text, font, (200, 200, 200))
+        assert actual.tobytes() == expected.tobytes()
+        assert cache.textbbox((0, 0), text, font) == draw.textbbox((0, 0), text, font=font)
+
+
+def test_textbbox_leading_spaces():
+    """先頭の空白も ImageDraw.textbbox と同じく範囲に含める（2桁以下のSGV）"""
+    cache = TextCache()
+    draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    for name, size in (('Riety-5yaEv.otf', 200), ('Riety-5yaEv.otf', 72), ('tsuchigumo.regular.otf', 24)):
+        font = ImageFont.truetype(os.path.join(FONT_DIR, name), size)
+        for text in (' 99', '  5', ' 85', ' ', '-10'):
+            for xy in ((0, 0), (20, 20)):
+                assert cache.textbbox(xy, text, font) == draw.textbbox(xy, text, font=font), (name, size, text)
+
+
+def test_lru_and_counters():
+    cache = TextCache(max_entries=3)
+    font = ImageFont.truetype(os.path.join(FONT_DIR, 'tsuchigumo.regular.otf'), 24)
+    cache.preload(font, '012')
+    cache.draw_text(Image.new('RGB', (100, 30)), (0, 0), '01', font, (255, 255, 255))
+    cache.glyph(font, '3')  # '2' が追い出される
+    assert cache.stats() == {'entries': 3, 'hits': 2, 'misses': 4}
+    assert (font.path, font.size, '2') not in cache.entries
@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import random
+
+import numpy as np
+from sgvmon.lib.trend import TrendEngine, trend_arrow, RATE_WINDOW
+
+START = 1_700_000_000_000
+STEP = 300_000  # 5分
+
+
+def test_linear_rise():
+    engine = TrendEngine()
+    for i in range(10):
+        engine.add(START + i * STEP, 100 + i * 10)  # 2 mg/dL/min
+    trend = engine.current()
+    assert abs(trend.rate - 2.0) < 1e-9
+    assert trend.arrow == 'SingleUp'
+    assert trend.forecast_time == START + 9 * STEP + 30 * 60_000
+    assert trend.forecast == 190 + 60
+
+
+def test_arrow_thresholds():
+    assert trend_arrow(0.99) == trend_arrow(-0.99) == 'Flat'
+    assert trend_arrow(1) == 'FortyFiveUp'
+    assert trend_arrow(-1) == 'FortyFiveDown'
+    assert trend_arrow(2.5) == 'SingleUp'
+    assert trend_arrow(-2.5) == 'SingleDown'
+    assert trend_arrow(3) == 'DoubleUp'
+    assert trend_arrow(-3.5) == 'DoubleDown'
+
+
+def test_matches_full_fit():
+    # 欠測とノイズのある長い履歴でも、毎回すべて計算し直した結果と一致する
+    rng = random.Random(1)
+    engine = TrendEngine()
+    timestamps, values = [], []
+    t = START
+    for _ in range(3000):
+        t += STEP * rng.choice((1, 1, 1, 2)) + rng.randint(-5000, 5000)
+        value = rng.randint(40, 400)
+        engine.add(t, value)
+        timestamps.append(t)
+        values.append(value)
+        window = [(ts, v) for ts, v in zip(timestamps, values) if t - ts <= RATE_WINDOW]
+        trend = engine.current()
+        if len(window) < 3:
+            assert trend is None
+            continue
+        x = np.array([ts - window[0][0] for ts, _ in window], np.float64)
+        y = np.array([v for _, v in window], np.float64)
+        assert abs(trend.rate - np.polyfit(x, y, 1)[0] * 60_000) < 1e-6
+    assert engine.n <= 4
+
+
+def test_gap_and_clamp():
+    engine = TrendEngine()
+    for i in range(4):
+        engine.add(START + i * STEP, 300 + i * 30)
+    assert engine.current().forecast == 400  # 表示できる範囲に収める
+    # 古いレコードと重複は無視する
+    assert not engine.add(START + STEP, 100)
+    # 長い欠測の後は件数がそろうまでトレンドを出さない
+    engine.add(START + 100 * STEP, 120)
+    engine.add(START + 101 * STEP, 125)
+    assert engine.current() is None
+    engine.add(START + 102 * STEP, 130)
+    assert engine.current().rate == 1.0